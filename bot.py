@@ -1,7 +1,17 @@
 import os
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Tuple, Union
+import json
+import sqlite3
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Iterable, List, Tuple, Union
 import asyncio
+import heapq
+import time
+from bisect import bisect_right
+from functools import lru_cache, wraps
 from dotenv import load_dotenv
 import re
 from html import escape
@@ -17,6 +27,9 @@ from telegram.ext import (
     filters
 )
 
+# Parse mode of the callback button replies, bound once instead of looked up on every edit
+_MD = ParseMode.MARKDOWN
+
 # Store warnings: {(chat_id, user_id): count}
 warnings_store: Dict[Tuple[int, int], int] = {}
 
@@ -29,40 +42,353 @@ welcome_images: Dict[int, str] = {}
 # Store service message: {chat_id: message}
 service_messages: Dict[int, str] = {}
 
-# Store user restrictions: {(chat_id, user_id): {restriction: bool}}
-user_restrictions: Dict[Tuple[int, int], Dict[str, bool]] = {}
+# Restriction flags, in the order they are listed
+_BITS = {'flood': 1, 'spam': 2, 'media': 4, 'checks': 8, 'night': 16, 'sticker': 32, 'gif': 64, 'link': 128}
+
+
+
+class RestrictionStore:
+    """Restriction masks per (chat_id, user_id), kept in SQLite behind an in-memory LRU cache"""
+    
+    def __init__(self, path: str, maxsize: int = 10_000):
+        self._path = path
+        self._maxsize = maxsize
+        self._db: "sqlite3.Connection | None" = None
+        # All database work runs on this one thread, never on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="restrictions")
+        # {chat_id: {user_id: mask}}, chats and their users in LRU order; None = no row
+        self._cache: "OrderedDict[int, Dict[int, int | None]]" = OrderedDict()
+        self._size = 0  # Cached (chat_id, user_id) entries across all chats
+        # Single-slot cache of the last user read or written; toggles come in bursts on one target
+        self._last: "Tuple[int, int, int | None] | None" = None
+    
+    def _conn(self) -> sqlite3.Connection:
+        """Open the database on first use (database thread only)"""
+        if self._db is None:
+            self._db = sqlite3.connect(self._path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS restrictions ("
+                "chat_id INTEGER, target_id INTEGER, mask INTEGER NOT NULL, "
+                "PRIMARY KEY (chat_id, target_id))"
+            )
+        return self._db
+    
+    def _select(self, chat_id: int, user_id: int) -> "int | None":
+        row = self._conn().execute(
+            "SELECT mask FROM restrictions WHERE chat_id = ? AND target_id = ?", (chat_id, user_id)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def _upsert(self, chat_id: int, user_id: int, mask: int) -> None:
+        with self._conn() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO restrictions (chat_id, target_id, mask) VALUES (?, ?, ?)",
+                (chat_id, user_id, mask)
+            )
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    def _cached(self, chat_id: int, user_id: int) -> "Tuple[bool, int | None]":
+        """(found, mask) from the cache, marking the entry as recently used"""
+        last = self._last
+        if last is not None and last[0] == chat_id and last[1] == user_id:
+            return True, last[2]
+        users = self._cache.get(chat_id)
+        if users is None or user_id not in users:
+            return False, None
+        self._cache.move_to_end(chat_id)
+        users[user_id] = mask = users.pop(user_id)
+        self._last = (chat_id, user_id, mask)
+        return True, mask
+    
+    def _remember(self, chat_id: int, user_id: int, mask: "int | None") -> None:
+        self._last = (chat_id, user_id, mask)
+        users = self._cache.get(chat_id)
+        if users is None:
+            users = self._cache[chat_id] = {}
+        if user_id in users:
+            del users[user_id]
+        else:
+            self._size += 1
+        users[user_id] = mask
+        self._cache.move_to_end(chat_id)
+        # Evict whole chats, least recently used first; once only this chat is left, its oldest users
+        while self._size > self._maxsize:
+            oldest_chat, oldest_users = next(iter(self._cache.items()))
+            if oldest_chat == chat_id:
+                del users[next(iter(users))]
+                self._size -= 1
+            else:
+                del self._cache[oldest_chat]
+                self._size -= len(oldest_users)
+    
+    async def get(self, chat_id: int, user_id: int) -> "int | None":
+        """Mask for a user, or None if no restrictions were ever set"""
+        found, mask = self._cached(chat_id, user_id)
+        if found:
+            return mask
+        mask = await self._run(self._select, chat_id, user_id)
+        # A write may have landed while the read was in flight; it wins
+        found, cached = self._cached(chat_id, user_id)
+        if found:
+            return cached
+        self._remember(chat_id, user_id, mask)
+        return mask
+    
+    async def setdefault(self, chat_id: int, user_id: int) -> int:
+        """Mask for a user, creating an unrestricted entry if there is none"""
+        mask = await self.get(chat_id, user_id)
+        if mask is None:
+            mask = 0
+            await self.set(chat_id, user_id, mask)
+        return mask
+    
+    async def set(self, chat_id: int, user_id: int, mask: int) -> None:
+        await self._run(self._upsert, chat_id, user_id, mask)
+        self._remember(chat_id, user_id, mask)
+
+
+# Store the restriction mask last applied with Save & Apply: {(chat_id, user_id): mask}
+_applied_mask: Dict[Tuple[int, int], int] = {}
+
+
+def _forget_applied(chat_id: int, user_id: int) -> None:
+    """Drop the applied mask after the bot changes a member's permissions some other way"""
+    _applied_mask.pop((chat_id, user_id), None)
+
+
+# Store filters: {chat_id: {keyword: {'type': 'photo/sticker/video/gif', 'file_id': str, 'caption': str}}}
+filters_store: Dict[int, Dict[str, Dict[str, str]]] = {}
+
+
+@dataclass(slots=True)
+class ChatSettings:
+    """Per-chat configuration, in the order shown on the configuration panel"""
+    self_destruct: int = 0  # seconds, 0 = disabled
+    edit_del: bool = False
+    nsfw: bool = False
+    service_enabled: bool = True
+    service_del: int = 30  # seconds
+    event_enabled: bool = True
+    event_del: int = 30  # seconds
+    warn_threshold: int = 3
+    mute_hours: int = 24
+    # Whether service/event settings were ever changed (only those chats count as active)
+    service_configured: bool = False
+    event_configured: bool = False
+
+
+# Store chat settings: {chat_id: ChatSettings}
+chat_settings: Dict[int, ChatSettings] = {}
+
+# Settings of chats that never configured anything (read-only, never stored or mutated)
+_DEFAULT_CHAT_SETTINGS = ChatSettings()
+
+# Write-behind persistence of chat_settings, so toggles never wait on disk I/O
+SETTINGS_FLUSH_DELAY = 2.0  # seconds to collect changes before writing
+_settings_dirty = False
+_settings_flush_task: "asyncio.Task | None" = None
+
+# Running totals for the reload summaries, kept in sync at every write site:
+# chats with each setting active and filters across all chats
+_active_counts: Dict[str, int] = {
+    'self_destruct': 0, 'edit_del': 0, 'nsfw': 0, 'warn': 0, 'service': 0, 'event': 0, 'filters': 0
+}
+
+# Permission sets for muting and unmuting members (immutable, shared by every call)
+_PERMS_MUTED = ChatPermissions(
+    can_send_messages=False,
+    can_send_audios=False,
+    can_send_documents=False,
+    can_send_photos=False,
+    can_send_videos=False,
+    can_send_video_notes=False,
+    can_send_voice_notes=False,
+    can_send_polls=False,
+    can_add_web_page_previews=False
+)
+_PERMS_UNMUTED = ChatPermissions(
+    can_send_messages=True,
+    can_send_audios=True,
+    can_send_documents=True,
+    can_send_photos=True,
+    can_send_videos=True,
+    can_send_video_notes=True,
+    can_send_voice_notes=True,
+    can_send_polls=True,
+    can_add_web_page_previews=True
+)
+
+# Cache admin lookups: {(chat_id, user_id): (is_admin, expires_at)}
+_admin_cache: Dict[Tuple[int, int], Tuple[bool, float]] = {}
+ADMIN_CACHE_TTL = 60  # seconds
+ADMIN_CACHE_MAX_SIZE = 10_000
+
+load_dotenv()
 
-# Store filters: {(chat_id, keyword): {'type': 'photo/sticker/video/gif', 'file_id': str, 'caption': str}}
-filters_store: Dict[Tuple[int, str], Dict[str, str]] = {}
+# Where settings and restrictions are kept (set in the environment or .env)
+CHAT_SETTINGS_FILE = os.environ.get("CHAT_SETTINGS_FILE", "chat_settings.json")
+RESTRICTIONS_DB = os.environ.get("RESTRICTIONS_DB", "restrictions.db")
 
-# Store self-destruct timers: {chat_id: seconds}
-self_destruct_timers: Dict[int, int] = {}
+# Store user restrictions: {chat_id: {user_id: bitmask of _BITS (0 = unrestricted)}}
+user_restrictions = RestrictionStore(RESTRICTIONS_DB)
 
-# Store edit message deletion setting: {chat_id: bool (True = enabled, False = disabled)}
-edit_deletion_enabled: Dict[int, bool] = {}
 
-# Store warning settings: {chat_id: {'threshold': int, 'mute_duration': int}}
-warning_settings: Dict[int, Dict[str, int]] = {}
+async def is_admin(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> bool:
+    """Check if user is admin or creator (answers are cached for ADMIN_CACHE_TTL seconds)"""
+    key = (chat_id, user_id)
+    now = time.monotonic()
+    cached = _admin_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+    
+    try:
+        member = await context.bot.get_chat_member(chat_id, user_id)
+    except Exception:
+        return False  # Not cached, so the next call retries
+    
+    result = member.status in ("administrator", "creator")
+    if len(_admin_cache) >= ADMIN_CACHE_MAX_SIZE:
+        # Evict lazily: drop expired entries, or everything if all are still fresh
+        for expired in [k for k, (_, expires_at) in _admin_cache.items() if expires_at <= now]:
+            del _admin_cache[expired]
+        if len(_admin_cache) >= ADMIN_CACHE_MAX_SIZE:
+            _admin_cache.clear()
+    _admin_cache[key] = (result, now + ADMIN_CACHE_TTL)
+    return result
+
+
+def require_admin(func=None, *, denied_text: str = "❌ Only admins can use this command."):
+    """Decorator that lets a command handler run only for admins of the chat"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+            if not await is_admin(context, update.effective_chat.id, update.effective_user.id):
+                await update.message.reply_text(denied_text)
+                return
+            return await handler(update, context, *args, **kwargs)
+        return wrapper
+    
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def _count_active(settings: ChatSettings, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) a chat's settings from the reload summary counts"""
+    _active_counts['self_destruct'] += sign * (settings.self_destruct > 0)
+    _active_counts['edit_del'] += sign * settings.edit_del
+    _active_counts['nsfw'] += sign * settings.nsfw
+    _active_counts['warn'] += sign * (
+        (settings.warn_threshold, settings.mute_hours)
+        != (_DEFAULT_CHAT_SETTINGS.warn_threshold, _DEFAULT_CHAT_SETTINGS.mute_hours)
+    )
+    _active_counts['service'] += sign * (settings.service_configured and settings.service_enabled)
+    _active_counts['event'] += sign * (settings.event_configured and settings.event_enabled)
 
-# Store NSFW filtering settings: {chat_id: bool (True = enabled, False = disabled)}
-nsfw_filter_enabled: Dict[int, bool] = {}
 
-# Store service message settings: {chat_id: {'enabled': bool, 'delete_after': int}}
-service_msg_settings: Dict[int, Dict[str, Union[bool, int]]] = {}
+def _settings_before_change(chat_id: int) -> ChatSettings:
+    """Fetch (or create) a chat's settings with one lookup, taking them out of the summary counts"""
+    settings = chat_settings.get(chat_id)
+    if settings is None:
+        settings = chat_settings[chat_id] = ChatSettings()
+    else:
+        _count_active(settings, -1)
+    return settings
+
+
+def _settings_after_change(settings: ChatSettings, names: Iterable[str]) -> None:
+    """Count a chat's changed settings again and schedule them to be saved"""
+    for name in names:
+        if name.startswith('service_'):
+            settings.service_configured = True
+        elif name.startswith('event_'):
+            settings.event_configured = True
+    _count_active(settings, 1)
+    _mark_settings_dirty()
+
+
+def update_chat_settings(chat_id: int, **changes: Union[bool, int]) -> ChatSettings:
+    """Update a chat's settings and keep the reload summary counts in sync"""
+    settings = _settings_before_change(chat_id)
+    for name, value in changes.items():
+        setattr(settings, name, value)
+    _settings_after_change(settings, changes)
+    return settings
+
+
+def toggle_chat_setting(chat_id: int, name: str) -> bool:
+    """Flip one of a chat's on/off settings and return the new value"""
+    settings = _settings_before_change(chat_id)
+    value = not getattr(settings, name)
+    setattr(settings, name, value)
+    _settings_after_change(settings, (name,))
+    return value
+
+
+def _write_chat_settings(snapshot: Dict[str, Dict[str, Union[bool, int]]]) -> None:
+    """Atomically replace the settings file with a snapshot of all chat settings"""
+    tmp_path = CHAT_SETTINGS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, CHAT_SETTINGS_FILE)
+
+
+async def _flush_chat_settings_after(delay: float) -> None:
+    """Write chat settings to disk once changes have settled for a while"""
+    global _settings_dirty, _settings_flush_task
+    try:
+        await asyncio.sleep(delay)
+        _settings_dirty = False
+        snapshot = {str(chat_id): asdict(settings) for chat_id, settings in chat_settings.items()}
+        await asyncio.get_running_loop().run_in_executor(None, _write_chat_settings, snapshot)
+    except Exception as e:
+        _settings_dirty = True  # Keep the changes for the next flush
+        print(f"❌ Failed to save chat settings: {e}")
+    finally:
+        _settings_flush_task = None
+    
+    if _settings_dirty:
+        _mark_settings_dirty()  # Changed again while writing
 
-# Store event message settings: {chat_id: {'enabled': bool, 'delete_after': int}}
-event_msg_settings: Dict[int, Dict[str, Union[bool, int]]] = {}
 
-load_dotenv()
+def _mark_settings_dirty() -> None:
+    """Schedule a write-behind flush of chat settings (one per SETTINGS_FLUSH_DELAY burst)"""
+    global _settings_dirty, _settings_flush_task
+    _settings_dirty = True
+    if _settings_flush_task is None:
+        try:
+            _settings_flush_task = asyncio.get_running_loop().create_task(
+                _flush_chat_settings_after(SETTINGS_FLUSH_DELAY)
+            )
+        except RuntimeError:
+            pass  # No event loop yet; the shutdown flush still saves the change
 
 
-async def is_admin(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> bool:
-    """Check if user is admin or creator"""
+def load_chat_settings() -> None:
+    """Load chat settings saved by a previous run, if any"""
     try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        return member.status in ("administrator", "creator")
-    except Exception:
-        return False
+        with open(CHAT_SETTINGS_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not load {CHAT_SETTINGS_FILE}: {e}")
+        return
+    
+    known = {field.name for field in fields(ChatSettings)}
+    for chat_id, values in saved.items():
+        settings = chat_settings[int(chat_id)] = ChatSettings(**{k: v for k, v in values.items() if k in known})
+        _count_active(settings, 1)
+
+
+async def save_chat_settings_on_shutdown(application) -> None:
+    """Write any settings changes still waiting for the write-behind flush"""
+    if _settings_dirty:
+        _write_chat_settings({str(chat_id): asdict(settings) for chat_id, settings in chat_settings.items()})
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -163,16 +489,9 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text(f"❌ Error checking status: {str(e)}")
 
 
+@require_admin(denied_text="❌ Only moderators and the group founder can use /settings.")
 async def settings_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Settings panel - only for moderators (admins) and founder"""
-    chat_id = update.effective_chat.id
-    user_id = update.effective_user.id
-
-    # Only admins (including founder/creator) can use this
-    if not await is_admin(context, chat_id, user_id):
-        await update.message.reply_text("❌ Only moderators and the group founder can use /settings.")
-        return
-
     text = (
         "⚙️ *Group Settings Panel*\n\n"
         "These settings can only be changed by moderators and the group founder.\n\n"
@@ -271,39 +590,25 @@ async def apply_warning(context: ContextTypes.DEFAULT_TYPE, chat_id: int, target
     warnings_store[key] = count
     
     # Get warning settings for this chat (default to 3 warnings, 24 hours)
-    settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-    threshold = settings['threshold']
-    mute_duration_hours = settings['mute_duration']
+    settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+    threshold = settings.warn_threshold
+    mute_duration_hours = settings.mute_hours
     
     if count >= threshold:
         # Auto-mute for specified duration
         until = datetime.now(timezone.utc) + timedelta(hours=mute_duration_hours)
-        perms = ChatPermissions(
-            can_send_messages=False,
-            can_send_audios=False,
-            can_send_documents=False,
-            can_send_photos=False,
-            can_send_videos=False,
-            can_send_video_notes=False,
-            can_send_voice_notes=False,
-            can_send_polls=False,
-            can_add_web_page_previews=False
-        )
-        await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms, until_date=until)
+        _forget_applied(chat_id, target_id)
+        await context.bot.restrict_chat_member(chat_id, target_id, permissions=_PERMS_MUTED, until_date=until)
         warnings_store[key] = 0  # Reset warnings
         return count, True
     
     return count, False
 
 
+@require_admin
 async def ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Ban a user from the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -311,6 +616,7 @@ async def ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     try:
+        _forget_applied(chat_id, target_id)
         await context.bot.ban_chat_member(chat_id, target_id)
         
         # Create toggle button for ban status
@@ -329,14 +635,10 @@ async def ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(f"❌ Failed to ban user: {str(e)}")
 
 
+@require_admin
 async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Unban a user from the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -344,20 +646,17 @@ async def unban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     try:
+        _forget_applied(chat_id, target_id)
         await context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True)
         await update.message.reply_text("✅ User has been unbanned.")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to unban user: {str(e)}")
 
 
+@require_admin
 async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Mute a user in the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -380,6 +679,7 @@ async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             can_pin_messages=False,
             can_manage_topics=False
         )
+        _forget_applied(chat_id, target_id)
         await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
         
         # Create toggle button for mute status
@@ -398,14 +698,10 @@ async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(f"❌ Failed to mute user: {str(e)}")
 
 
+@require_admin
 async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Unmute a user in the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -413,31 +709,17 @@ async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     try:
-        perms = ChatPermissions(
-            can_send_messages=True,
-            can_send_audios=True,
-            can_send_documents=True,
-            can_send_photos=True,
-            can_send_videos=True,
-            can_send_video_notes=True,
-            can_send_voice_notes=True,
-            can_send_polls=True,
-            can_add_web_page_previews=True
-        )
-        await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
+        _forget_applied(chat_id, target_id)
+        await context.bot.restrict_chat_member(chat_id, target_id, permissions=_PERMS_UNMUTED)
         await update.message.reply_text("✅ User has been unmuted.")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to unmute user: {str(e)}")
 
 
+@require_admin
 async def warn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Warn a user (3 warnings = auto-mute for 24h)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -469,14 +751,10 @@ async def warn(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
+@require_admin
 async def check_warnings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Check warnings for a user"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -537,8 +815,9 @@ async def info_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         # Get restrictions if any
         restrictions_info = "None"
-        if key in user_restrictions:
-            active_restrictions = [k.title() for k, v in user_restrictions[key].items() if v]
+        mask = await user_restrictions.get(chat_id, user_id)
+        if mask is not None:
+            active_restrictions = [name.title() for name, bit in _BITS.items() if mask & bit]
             if active_restrictions:
                 restrictions_info = ", ".join(active_restrictions)
         
@@ -657,17 +936,21 @@ async def greet_new_members(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 )
 
 
-async def delete_links(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Delete messages containing links and warn users"""
+# Links Telegram does not always mark as entities, such as bare t.me/... references
+_URL_RE = re.compile(r"(?i)(https?://|www\.)\S+|t\.me/\S+")
+
+
+async def delete_links(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Delete messages containing links and warn users (True if the message was removed)"""
     msg = update.message
     if not msg:
-        return
+        return False
     
     chat_id = msg.chat.id
     user_id = msg.from_user.id if msg.from_user else None
     
     if not user_id:
-        return
+        return False
     
     # Check for links in entities
     entities = list(msg.entities or []) + list(msg.caption_entities or [])
@@ -677,16 +960,14 @@ async def delete_links(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not has_link:
         text = (msg.text or "") + " " + (msg.caption or "")
         if text:
-            url_regex = re.compile(r"(?i)(https?://|www\.)\S+|t\.me/\S+")
-            has_link = bool(url_regex.search(text))
+            has_link = bool(_URL_RE.search(text))
     
     if has_link:
         # Check if user has link permission from free command
-        key = (chat_id, user_id)
-        if key in user_restrictions:
-            restrictions = user_restrictions[key]
-            if not restrictions.get('link', False):  # If link restriction is OFF, allow links
-                return
+        mask = await user_restrictions.get(chat_id, user_id)
+        if mask is not None:
+            if not mask & _BITS['link']:  # If link restriction is OFF, allow links
+                return False
         
         # Delete the message
         try:
@@ -743,31 +1024,32 @@ async def delete_links(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 )
             except Exception:
                 pass
+        return True
+    
+    return False
 
 
-async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check if message contains restricted content based on free command settings"""
+async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Check if message contains restricted content based on free command settings (True if removed)"""
     msg = update.message
-    if not msg or msg.chat.type not in ("group", "supergroup"):
-        return
+    if not msg or msg.chat.type not in ("group", "supergroup") or not msg.from_user:
+        return False
     
     chat_id = msg.chat.id
     user_id = msg.from_user.id
     
+    # Get user restrictions (checked before the admin lookup, which may need an API call)
+    restrictions = await user_restrictions.get(chat_id, user_id)
+    if restrictions is None:
+        return False  # No restrictions set
+    
     # Check if user is admin
     admin = await is_admin(context, chat_id, user_id)
     if admin:
-        return
-    
-    # Get user restrictions
-    key = (chat_id, user_id)
-    if key not in user_restrictions:
-        return  # No restrictions set
-    
-    restrictions = user_restrictions[key]
+        return False
     
     # Check for stickers
-    if msg.sticker and restrictions.get('sticker', False):
+    if msg.sticker and restrictions & _BITS['sticker']:
         try:
             await msg.delete()
         except Exception:
@@ -804,9 +1086,10 @@ async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TY
                 )
             except Exception:
                 pass
+        return True
     
     # Check for GIFs (animations)
-    elif msg.animation and restrictions.get('gif', False):
+    elif msg.animation and restrictions & _BITS['gif']:
         try:
             await msg.delete()
         except Exception:
@@ -843,9 +1126,10 @@ async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TY
                 )
             except Exception:
                 pass
+        return True
     
     # Check for videos
-    elif msg.video and restrictions.get('video', False):
+    elif msg.video and restrictions & _BITS.get('video', 0):  # No video toggle yet
         try:
             await msg.delete()
         except Exception:
@@ -882,11 +1166,12 @@ async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TY
                 )
             except Exception:
                 pass
+        return True
     
     # Check for NSFW media content
     elif msg.photo or msg.video or msg.animation or msg.document:
         # Check if NSFW filtering is enabled for this chat
-        if nsfw_filter_enabled.get(chat_id, False):
+        if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).nsfw:
             is_nsfw_media = await detect_nsfw_media(context, msg)
             if is_nsfw_media:
                 try:
@@ -911,6 +1196,9 @@ async def check_message_content(update: Update, context: ContextTypes.DEFAULT_TY
                         f"⚠️ {mention} warned for inappropriate content. Warnings: {count}/3",
                         parse_mode=ParseMode.HTML
                     )
+                return True
+    
+    return False
 
 
 async def detect_nsfw_media(context: ContextTypes.DEFAULT_TYPE, msg) -> bool:
@@ -964,7 +1252,7 @@ async def on_edited(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = msg.from_user.id
     
     # Check if edit deletion is enabled for this chat
-    if not edit_deletion_enabled.get(chat_id, False):
+    if not chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).edit_del:
         return  # Skip if edit deletion is disabled
     
     # Delete edited message regardless of user type
@@ -1017,14 +1305,10 @@ async def approve_join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             pass
 
 
+@require_admin
 async def set_welcome_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set custom welcome message for the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Get the message text after the command
     args = context.args
@@ -1052,14 +1336,10 @@ async def set_welcome_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
 
 
+@require_admin
 async def set_welcome_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set welcome image for the group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Check if replying to a message with photo
     if not update.message.reply_to_message or not update.message.reply_to_message.photo:
@@ -1076,14 +1356,10 @@ async def set_welcome_image(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text("✅ Welcome image set successfully!")
 
 
+@require_admin
 async def reset_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Reset welcome message and image to default"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Remove custom welcome message and image
     message_removed = chat_id in welcome_messages
@@ -1107,14 +1383,10 @@ async def reset_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("ℹ️ No custom welcome settings found. Already using default.")
 
 
+@require_admin
 async def reset_welcome_image(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Reset only the welcome image to default"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Remove custom welcome image only
     if chat_id in welcome_images:
@@ -1139,14 +1411,10 @@ async def service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(service_text, parse_mode=ParseMode.MARKDOWN)
 
 
+@require_admin
 async def set_service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set free service information (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Get the message text after the command
     args = context.args
@@ -1169,14 +1437,10 @@ async def set_service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     )
 
 
+@require_admin
 async def reset_service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Reset service information to default (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Remove custom service message
     if chat_id in service_messages:
@@ -1186,86 +1450,50 @@ async def reset_service(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("ℹ️ No custom service information found. Already using default.")
 
 
+@require_admin
 async def enable_service_msgs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enable service messages in the group (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    # Initialize settings if not exists
-    if chat_id not in service_msg_settings:
-        service_msg_settings[chat_id] = {'enabled': True, 'delete_after': 30}
-    else:
-        service_msg_settings[chat_id]['enabled'] = True
+    update_chat_settings(chat_id, service_enabled=True)
     
     await update.message.reply_text("✅ Service messages have been enabled!")
 
 
+@require_admin
 async def disable_service_msgs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disable service messages in the group (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    # Initialize settings if not exists
-    if chat_id not in service_msg_settings:
-        service_msg_settings[chat_id] = {'enabled': False, 'delete_after': 30}
-    else:
-        service_msg_settings[chat_id]['enabled'] = False
+    update_chat_settings(chat_id, service_enabled=False)
     
     await update.message.reply_text("✅ Service messages have been disabled!")
 
 
+@require_admin
 async def enable_event_msgs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enable event messages in the group (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    # Initialize settings if not exists
-    if chat_id not in event_msg_settings:
-        event_msg_settings[chat_id] = {'enabled': True, 'delete_after': 30}
-    else:
-        event_msg_settings[chat_id]['enabled'] = True
+    update_chat_settings(chat_id, event_enabled=True)
     
     await update.message.reply_text("✅ Event messages have been enabled!")
 
 
+@require_admin
 async def disable_event_msgs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disable event messages in the group (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    # Initialize settings if not exists
-    if chat_id not in event_msg_settings:
-        event_msg_settings[chat_id] = {'enabled': False, 'delete_after': 30}
-    else:
-        event_msg_settings[chat_id]['enabled'] = False
+    update_chat_settings(chat_id, event_enabled=False)
     
     await update.message.reply_text("✅ Event messages have been disabled!")
 
 
+@require_admin
 async def set_service_del_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set the deletion time for service messages (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args or not args[0].isdigit():
@@ -1281,23 +1509,15 @@ async def set_service_del_time(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Time must be at least 1 second.")
         return
     
-    # Initialize settings if not exists
-    if chat_id not in service_msg_settings:
-        service_msg_settings[chat_id] = {'enabled': True, 'delete_after': seconds}
-    else:
-        service_msg_settings[chat_id]['delete_after'] = seconds
+    update_chat_settings(chat_id, service_del=seconds)
     
     await update.message.reply_text(f"✅ Service message deletion time set to {seconds} seconds!")
 
 
+@require_admin
 async def set_event_del_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set the deletion time for event messages (admin only)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args or not args[0].isdigit():
@@ -1313,23 +1533,79 @@ async def set_event_del_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Time must be at least 1 second.")
         return
     
-    # Initialize settings if not exists
-    if chat_id not in event_msg_settings:
-        event_msg_settings[chat_id] = {'enabled': True, 'delete_after': seconds}
-    else:
-        event_msg_settings[chat_id]['delete_after'] = seconds
+    update_chat_settings(chat_id, event_del=seconds)
     
     await update.message.reply_text(f"✅ Event message deletion time set to {seconds} seconds!")
 
 
+@lru_cache(maxsize=256)
+def _perms_for(mask: int) -> ChatPermissions:
+    """Chat permissions for a restriction mask (stickers and GIFs are enforced by deleting messages)"""
+    can_send_media = not mask & _BITS['media']
+    return ChatPermissions(
+        can_send_messages=True,  # Always allow text
+        can_send_audios=can_send_media,
+        can_send_documents=can_send_media,
+        can_send_photos=can_send_media,
+        can_send_videos=can_send_media,
+        can_send_video_notes=can_send_media,
+        can_send_voice_notes=can_send_media,
+        can_send_polls=not mask & _BITS['spam'],
+        can_add_web_page_previews=not mask & (_BITS['link'] | _BITS['spam'])
+    )
+
+
+# Restriction manager button labels: {(restriction, restricted): label}
+_LABELS = {
+    (name, restricted): f"{'✅' if restricted else '❌'} {label}"
+    for name, label in (
+        ('flood', 'Flood'), ('spam', 'Spam'), ('media', 'Media'), ('checks', 'Checks'),
+        ('sticker', 'Sticker'), ('gif', 'GIF'), ('link', 'Link'), ('night', 'Silence/Night'),
+    )
+    for restricted in (False, True)
+}
+
+
+@lru_cache(maxsize=4096)
+def _restriction_button(target_id: int, name: str, restricted: bool) -> InlineKeyboardButton:
+    """Toggle button for one restriction (buttons are immutable, so every keyboard can share them)"""
+    return InlineKeyboardButton(_LABELS[(name, restricted)], callback_data=f"free_{target_id}_{name}")
+
+
+@lru_cache(maxsize=1024)
+def _apply_restrictions_button(target_id: int) -> InlineKeyboardButton:
+    """'Save & Apply' button of the restriction manager"""
+    return InlineKeyboardButton("💾 Save & Apply", callback_data=f"free_{target_id}_apply")
+
+
+# Restriction manager layout: rows of (restriction, bit)
+_LAYOUT = tuple(
+    tuple((name, _BITS[name]) for name in row)
+    for row in (('flood', 'spam'), ('media', 'checks'), ('sticker', 'gif'), ('link', 'night'))
+)
+
+
+def make_restriction_kb(target_id: int, r: int) -> InlineKeyboardMarkup:
+    """Restriction manager keyboard shown by /free and its toggle buttons (r is a _BITS mask)"""
+    keyboard = [
+        [_restriction_button(target_id, name, bool(r & bit)) for name, bit in row]
+        for row in _LAYOUT
+    ]
+    keyboard.append([_apply_restrictions_button(target_id)])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def compute_toggle(mask: int, restriction_type: str) -> Tuple[int, "ChatPermissions | None"]:
+    """Mask after a restriction manager button, plus the permissions to set when it is 'apply'"""
+    if restriction_type == "apply":
+        return mask, _perms_for(mask)
+    return mask ^ _BITS[restriction_type], None
+
+
+@require_admin
 async def free_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Manage user restrictions with toggle buttons"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Try to resolve target user from reply, mention, username, or ID
     target_id = await resolve_target_user_id(update, context)
@@ -1356,72 +1632,10 @@ async def free_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
     
     # Get current restrictions or initialize
-    key = (chat_id, target_id)
-    if key not in user_restrictions:
-        user_restrictions[key] = {
-            'flood': False,
-            'spam': False,
-            'media': False,
-            'checks': False,
-            'night': False,
-            'sticker': False,
-            'gif': False,
-            'link': False
-        }
-    
-    restrictions = user_restrictions[key]
+    restrictions = await user_restrictions.setdefault(chat_id, target_id)
     
     # Create inline keyboard with toggle buttons
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['flood'] else '❌'} Flood",
-                callback_data=f"free_{target_id}_flood"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['spam'] else '❌'} Spam",
-                callback_data=f"free_{target_id}_spam"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['media'] else '❌'} Media",
-                callback_data=f"free_{target_id}_media"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['checks'] else '❌'} Checks",
-                callback_data=f"free_{target_id}_checks"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['sticker'] else '❌'} Sticker",
-                callback_data=f"free_{target_id}_sticker"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['gif'] else '❌'} GIF",
-                callback_data=f"free_{target_id}_gif"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['link'] else '❌'} Link",
-                callback_data=f"free_{target_id}_link"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if restrictions['night'] else '❌'} Silence/Night",
-                callback_data=f"free_{target_id}_night"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                "💾 Save & Apply",
-                callback_data=f"free_{target_id}_apply"
-            )
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = make_restriction_kb(target_id, restrictions)
     
     await update.message.reply_text(
         f"🔧 *Restriction Manager*\n\n"
@@ -1435,14 +1649,10 @@ async def free_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@require_admin
 async def filter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set a filter for a keyword with media response"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     # Check if replying to a message with media
     if not update.message.reply_to_message:
@@ -1492,8 +1702,10 @@ async def filter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
     
     # Store the filter
-    key = (chat_id, keyword)
-    filters_store[key] = {
+    chat_filters = filters_store.setdefault(chat_id, {})
+    if keyword not in chat_filters:
+        _active_counts['filters'] += 1
+    chat_filters[keyword] = {
         'type': media_type,
         'file_id': file_id,
         'caption': caption
@@ -1513,7 +1725,7 @@ async def filters_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     chat_id = update.effective_chat.id
     
     # Get all filters for this chat
-    chat_filters = {k: v for k, v in filters_store.items() if k[0] == chat_id}
+    chat_filters = filters_store.get(chat_id, {})
     
     if not chat_filters:
         await update.message.reply_text(
@@ -1525,7 +1737,7 @@ async def filters_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     
     # Build filter list
     filter_list = "📝 *Active Filters:*\n\n"
-    for (_, keyword), data in chat_filters.items():
+    for keyword, data in chat_filters.items():
         filter_list += f"• `{keyword}` → {data['type'].title()}\n"
     
     filter_list += f"\n_Total: {len(chat_filters)} filter(s)_"
@@ -1533,14 +1745,10 @@ async def filters_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await update.message.reply_text(filter_list, parse_mode=ParseMode.MARKDOWN)
 
 
+@require_admin
 async def stopfilter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Remove a filter"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args:
@@ -1553,10 +1761,13 @@ async def stopfilter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     keyword = " ".join(args).lower()
-    key = (chat_id, keyword)
+    chat_filters = filters_store.get(chat_id, {})
     
-    if key in filters_store:
-        del filters_store[key]
+    if keyword in chat_filters:
+        del chat_filters[keyword]
+        _active_counts['filters'] -= 1
+        if not chat_filters:
+            del filters_store[chat_id]
         await update.message.reply_text(
             f"✅ Filter removed successfully!\n\n"
             f"Keyword: `{keyword}`",
@@ -1569,14 +1780,10 @@ async def stopfilter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
 
 
+@require_admin
 async def _demote_to_member(update: Update, context: ContextTypes.DEFAULT_TYPE, role_label: str) -> None:
     """Helper to demote a user from a role back to normal member"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -1596,19 +1803,16 @@ async def _demote_to_member(update: Update, context: ContextTypes.DEFAULT_TYPE,
             can_promote_members=False,
             can_manage_topics=False,
         )
+        _admin_cache.pop((chat_id, target_id), None)  # Role changed
         await update.message.reply_text(f"✅ User demoted from {role_label} to member.")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to demote user: {str(e)}")
 
 
+@require_admin
 async def promote_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Promote a user to full admin"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -1628,19 +1832,16 @@ async def promote_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             can_promote_members=True,
             can_manage_topics=True,
         )
+        _admin_cache.pop((chat_id, target_id), None)  # Role changed
         await update.message.reply_text("✅ User promoted to admin with full permissions.")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to promote user: {str(e)}")
 
 
+@require_admin
 async def promote_mod(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Promote a user to moderator (delete + restrict)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -1660,19 +1861,16 @@ async def promote_mod(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             can_promote_members=False,
             can_manage_topics=False,
         )
+        _admin_cache.pop((chat_id, target_id), None)  # Role changed
         await update.message.reply_text("✅ User promoted to moderator (can delete & restrict).")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to promote user: {str(e)}")
 
 
+@require_admin
 async def promote_muter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Promote a user to muter (mute + manage voice chat)"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     target_id = await resolve_target_user_id(update, context)
     if not target_id:
@@ -1692,6 +1890,7 @@ async def promote_muter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             can_promote_members=False,
             can_manage_topics=False,
         )
+        _admin_cache.pop((chat_id, target_id), None)  # Role changed
         await update.message.reply_text("✅ User promoted to muter (can mute users & manage voice chat).")
     except Exception as e:
         await update.message.reply_text(f"❌ Failed to promote user: {str(e)}")
@@ -1712,33 +1911,35 @@ async def unmuter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await _demote_to_member(update, context, "muter")
 
 
+# Usage texts for /setselfdestruct
+_SELF_DESTRUCT_CURRENT_HELP = (
+    "⏱️ Current self-destruct timer: {current} seconds\n\n"
+    "Usage: `/setselfdestruct <seconds>`\n"
+    "Example: `/setselfdestruct 30` (messages delete after 30 seconds)\n\n"
+    "Set to 0 to disable or use `/resetselfdestruct`"
+)
+_SELF_DESTRUCT_DISABLED_HELP = (
+    "ℹ️ Self-destruct is currently disabled.\n\n"
+    "Usage: `/setselfdestruct <seconds>`\n"
+    "Example: `/setselfdestruct 30` (messages delete after 30 seconds)"
+)
+
+
+@require_admin
 async def set_self_destruct(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set self-destruct timer for bot messages in this group"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args:
-        current_timer = self_destruct_timers.get(chat_id, 0)
+        current_timer = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).self_destruct
         if current_timer > 0:
             await update.message.reply_text(
-                f"⏱️ Current self-destruct timer: {current_timer} seconds\n\n"
-                "Usage: `/setselfdestruct <seconds>`\n"
-                "Example: `/setselfdestruct 30` (messages delete after 30 seconds)\n\n"
-                "Set to 0 to disable or use `/resetselfdestruct`",
+                _SELF_DESTRUCT_CURRENT_HELP.format(current=current_timer),
                 parse_mode=ParseMode.MARKDOWN
             )
         else:
-            await update.message.reply_text(
-                "ℹ️ Self-destruct is currently disabled.\n\n"
-                "Usage: `/setselfdestruct <seconds>`\n"
-                "Example: `/setselfdestruct 30` (messages delete after 30 seconds)",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            await update.message.reply_text(_SELF_DESTRUCT_DISABLED_HELP, parse_mode=ParseMode.MARKDOWN)
         return
     
     try:
@@ -1747,12 +1948,10 @@ async def set_self_destruct(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ Timer must be 0 or positive. Use 0 to disable.")
             return
         
+        update_chat_settings(chat_id, self_destruct=seconds)
         if seconds == 0:
-            if chat_id in self_destruct_timers:
-                del self_destruct_timers[chat_id]
             await update.message.reply_text("✅ Self-destruct timer disabled.")
         else:
-            self_destruct_timers[chat_id] = seconds
             await update.message.reply_text(
                 f"✅ Self-destruct timer set to {seconds} seconds.\n\n"
                 f"Bot messages will automatically delete after {seconds}s."
@@ -1761,75 +1960,70 @@ async def set_self_destruct(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Please provide a valid number of seconds.")
 
 
+@require_admin
 async def reset_self_destruct(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Reset/disable self-destruct timer"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    if chat_id in self_destruct_timers:
-        del self_destruct_timers[chat_id]
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).self_destruct > 0:
+        update_chat_settings(chat_id, self_destruct=0)
         await update.message.reply_text("✅ Self-destruct timer disabled.")
     else:
         await update.message.reply_text("ℹ️ Self-destruct is already disabled.")
 
 
+@require_admin
 async def enable_edit_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enable automatic deletion of edited messages"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    edit_deletion_enabled[chat_id] = True
+    update_chat_settings(chat_id, edit_del=True)
     await update.message.reply_text(
         "✅ Edit message deletion enabled.\n\n"
         "Non-admin edited messages will now be automatically deleted."
     )
 
 
+@require_admin
 async def disable_edit_deletion(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disable automatic deletion of edited messages"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
     
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
-    
-    if chat_id in edit_deletion_enabled:
-        del edit_deletion_enabled[chat_id]
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).edit_del:
+        update_chat_settings(chat_id, edit_del=False)
         await update.message.reply_text("✅ Edit message deletion disabled.")
     else:
         await update.message.reply_text("ℹ️ Edit message deletion is already disabled.")
 
 
+# Current warning settings shown by /setwarnlimit and /setmutetime
+_WARN_SETTINGS_TEXT = (
+    "⚙️ *Current Warning Settings:*\n\n"
+    "Threshold: {settings.warn_threshold} warnings → auto-mute\n"
+    "Mute Duration: {settings.mute_hours} hours\n\n"
+)
+_WARN_LIMIT_HELP = (
+    _WARN_SETTINGS_TEXT +
+    "Usage: `/setwarnlimit <number>`\n"
+    "Example: `/setwarnlimit 5` (auto-mute after 5 warnings)"
+)
+_MUTE_TIME_HELP = (
+    _WARN_SETTINGS_TEXT +
+    "Usage: `/setmutetime <hours>`\n"
+    "Example: `/setmutetime 12` (auto-mute for 12 hours)"
+)
+
+
+@require_admin
 async def set_warn_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set the warning threshold for auto-mute"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args:
         # Show current settings
-        settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-        await update.message.reply_text(
-            f"⚙️ *Current Warning Settings:*\n\n"
-            f"Threshold: {settings['threshold']} warnings → auto-mute\n"
-            f"Mute Duration: {settings['mute_duration']} hours\n\n"
-            f"Usage: `/setwarnlimit <number>`\n"
-            f"Example: `/setwarnlimit 5` (auto-mute after 5 warnings)",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+        await update.message.reply_text(_WARN_LIMIT_HELP.format(settings=settings), parse_mode=ParseMode.MARKDOWN)
         return
     
     try:
@@ -1838,10 +2032,7 @@ async def set_warn_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await update.message.reply_text("❌ Warning threshold must be greater than 0.")
             return
         
-        if chat_id not in warning_settings:
-            warning_settings[chat_id] = {'threshold': 3, 'mute_duration': 24}
-        
-        warning_settings[chat_id]['threshold'] = threshold
+        update_chat_settings(chat_id, warn_threshold=threshold)
         await update.message.reply_text(
             f"✅ Warning threshold set to {threshold}.\n"
             f"Users will be auto-muted after {threshold} warnings."
@@ -1850,27 +2041,16 @@ async def set_warn_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("❌ Please provide a valid number.")
 
 
+@require_admin
 async def set_mute_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set the auto-mute duration in hours"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
     args = context.args
     if not args:
         # Show current settings
-        settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-        await update.message.reply_text(
-            f"⚙️ *Current Warning Settings:*\n\n"
-            f"Threshold: {settings['threshold']} warnings → auto-mute\n"
-            f"Mute Duration: {settings['mute_duration']} hours\n\n"
-            f"Usage: `/setmutetime <hours>`\n"
-            f"Example: `/setmutetime 12` (auto-mute for 12 hours)",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+        await update.message.reply_text(_MUTE_TIME_HELP.format(settings=settings), parse_mode=ParseMode.MARKDOWN)
         return
     
     try:
@@ -1879,10 +2059,7 @@ async def set_mute_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             await update.message.reply_text("❌ Mute duration must be greater than 0 hours.")
             return
         
-        if chat_id not in warning_settings:
-            warning_settings[chat_id] = {'threshold': 3, 'mute_duration': 24}
-        
-        warning_settings[chat_id]['mute_duration'] = hours
+        update_chat_settings(chat_id, mute_hours=hours)
         await update.message.reply_text(
             f"✅ Auto-mute duration set to {hours} hours.\n"
             f"Users will be muted for {hours} hours when auto-muted."
@@ -1891,57 +2068,43 @@ async def set_mute_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("❌ Please provide a valid number.")
 
 
+@require_admin
 async def enable_nsfw_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enable NSFW content filtering"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    nsfw_filter_enabled[chat_id] = True
+    update_chat_settings(chat_id, nsfw=True)
     await update.message.reply_text(
         " Porno🔞 NSFW Content Filtering Enabled\n\n"
         "Messages containing potentially inappropriate content will be detected and removed."
     )
 
 
+@require_admin
 async def disable_nsfw_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Disable NSFW content filtering"""
     chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
     
-    if chat_id in nsfw_filter_enabled:
-        del nsfw_filter_enabled[chat_id]
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).nsfw:
+        update_chat_settings(chat_id, nsfw=False)
         await update.message.reply_text("✅ NSFW Content Filtering Disabled")
     else:
         await update.message.reply_text("ℹ️ NSFW Content Filtering is already disabled.")
 
 
+@require_admin
 async def reload_config(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Reload bot configuration and settings"""
-    chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can use this command.")
-        return
-    
     # In a real implementation, you might reload configuration files here
     # For now, we'll just confirm the reload and show current settings
     
     # Count active configurations
     active_configs = {
-        "Self-destruct timers": len([k for k, v in self_destruct_timers.items() if v > 0]),
-        "Edit deletion": len([k for k, v in edit_deletion_enabled.items() if v]),
-        "NSFW filtering": len([k for k, v in nsfw_filter_enabled.items() if v]),
-        "Warning settings": len(warning_settings),
-        "Filters": len([k for k, v in filters_store.items()])
+        "Self-destruct timers": _active_counts['self_destruct'],
+        "Edit deletion": _active_counts['edit_del'],
+        "NSFW filtering": _active_counts['nsfw'],
+        "Warning settings": _active_counts['warn'],
+        "Filters": _active_counts['filters']
     }
     
     total_active = sum(active_configs.values())
@@ -1963,186 +2126,305 @@ async def reload_config(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await update.message.reply_text(settings_text, parse_mode=ParseMode.MARKDOWN)
 
 
-async def config_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Open configuration panel for customizing bot settings"""
-    chat_id = update.effective_chat.id
-    admin_id = update.effective_user.id
-    
-    if not await is_admin(context, chat_id, admin_id):
-        await update.message.reply_text("❌ Only admins can access the configuration panel.")
-        return
-    
-    # Get current settings for this chat
-    current_self_destruct = self_destruct_timers.get(chat_id, 0)
-    current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-    current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-    current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-    current_service_enabled = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-    current_service_del_time = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-    current_event_enabled = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-    current_event_del_time = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-    
-    # Create inline keyboard with configuration buttons
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                f"⏰ Self-destruct: {current_self_destruct}s", 
-                callback_data="config_selfdestruct"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if current_edit_deletion else '❌'} Edit Del", 
-                callback_data="config_editdel"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                f"{'✅' if current_nsfw_filter else '❌'} NSFW Filter", 
-                callback_data="config_nsfw"
-            ),
-            InlineKeyboardButton(
-                f"{'✅' if current_service_enabled else '❌'} Service", 
-                callback_data="config_service"
-            )
+# Configuration panel text shown by /config and the config buttons
+_CONFIG_PANEL_TEXT = (
+    "⚙️ *Bot Configuration Panel*\n\n"
+    "*Current Settings for this Group:*\n"
+    "• Self-destruct timer: {self_destruct}s {self_destruct_status}\n"
+    "• Edit deletion: {edit_status}\n"
+    "• NSFW filtering: {nsfw_status}\n"
+    "• Service messages: {service_status}\n"
+    "• Event messages: {event_status}\n"
+    "• Warning threshold: {threshold} warnings\n"
+    "• Mute duration: {mute_duration} hours\n\n"
+    "👆 Tap buttons above to configure settings."
+)
+
+
+def _panel_state(chat_id: int) -> Tuple[int, bool, bool, bool | None, int, bool | None, int, int, int]:
+    """Snapshot of every setting shown on the configuration panel (None: not configured yet)"""
+    settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+    return (
+        settings.self_destruct,
+        settings.edit_del,
+        settings.nsfw,
+        settings.service_enabled if settings.service_configured else None,
+        settings.service_del,
+        settings.event_enabled if settings.event_configured else None,
+        settings.event_del,
+        settings.warn_threshold,
+        settings.mute_hours,
+    )
+
+
+@lru_cache(maxsize=512)
+def _build_config_keyboard(self_destruct: int, edit_deletion: bool, nsfw_filter: bool, service_enabled: bool | None,
+                           event_enabled: bool | None, threshold: int, mute_duration: int) -> InlineKeyboardMarkup:
+    """Configuration panel keyboard, shared between panels showing the same settings"""
+    keyboard = [
+        [
+            InlineKeyboardButton(f"⏰ Self-destruct: {self_destruct}s", callback_data="config_selfdestruct"),
+            InlineKeyboardButton(f"{'✅' if edit_deletion else '❌'} Edit Del", callback_data="config_editdel")
         ],
         [
-            InlineKeyboardButton(
-                f"{'✅' if current_event_enabled else '❌'} Event", 
-                callback_data="config_event"
-            ),
-            InlineKeyboardButton(
-                f"⚠️ Warn: {current_warn_settings['threshold']}", 
-                callback_data="config_warn"
-            )
+            InlineKeyboardButton(f"{'✅' if nsfw_filter else '❌'} NSFW Filter", callback_data="config_nsfw"),
+            InlineKeyboardButton(f"{'➖' if service_enabled is None else '✅' if service_enabled else '❌'} Service", callback_data="config_service")
         ],
         [
-            InlineKeyboardButton(
-                f"⏰ Mute: {current_warn_settings['mute_duration']}h", 
-                callback_data="config_mutedur"
-            ),
-            InlineKeyboardButton(
-                "🔄 Reload Config", 
-                callback_data="config_reload"
-            )
+            InlineKeyboardButton(f"{'➖' if event_enabled is None else '✅' if event_enabled else '❌'} Event", callback_data="config_event"),
+            InlineKeyboardButton(f"⚠️ Warn: {threshold}", callback_data="config_warn")
         ],
         [
-            InlineKeyboardButton(
-                "📋 View All Settings", 
-                callback_data="config_viewall"
-            )
+            InlineKeyboardButton(f"⏰ Mute: {mute_duration}h", callback_data="config_mutedur"),
+            InlineKeyboardButton("🔄 Reload Config", callback_data="config_reload")
+        ],
+        [
+            InlineKeyboardButton("📋 View All Settings", callback_data="config_viewall")
         ]
     ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _message_status(enabled: bool | None, delete_after: int) -> str:
+    """Config panel status of service or event messages (None: not configured, so left alone)"""
+    if enabled is None:
+        return '➖ Not configured'
+    return f"{'✅ Enabled' if enabled else '❌ Disabled'} (del after {delete_after}s)"
+
+
+def _build_config_panel(chat_id: int, message: str = "") -> Tuple[str, InlineKeyboardMarkup]:
+    """Build the configuration panel text and keyboard, optionally followed by a status message"""
+    (self_destruct, edit_deletion, nsfw_filter, service_enabled, service_del,
+     event_enabled, event_del, threshold, mute_duration) = _panel_state(chat_id)
+    
+    text = _CONFIG_PANEL_TEXT.format(
+        self_destruct=self_destruct,
+        self_destruct_status='✅ On' if self_destruct > 0 else '❌ Off',
+        edit_status='✅ Enabled' if edit_deletion else '❌ Disabled',
+        nsfw_status='✅ Enabled' if nsfw_filter else '❌ Disabled',
+        service_status=_message_status(service_enabled, service_del),
+        event_status=_message_status(event_enabled, event_del),
+        threshold=threshold,
+        mute_duration=mute_duration,
+    )
+    if message:
+        text += f"\n\n{message}"
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # Create configuration message with current settings
-    config_text = (
-        f"⚙️ *Bot Configuration Panel*\n\n"
-        f"*Current Settings for this Group:*\n"
-        f"• Self-destruct timer: {current_self_destruct}s {'✅ On' if current_self_destruct > 0 else '❌ Off'}\n"
-        f"• Edit deletion: {'✅ Enabled' if current_edit_deletion else '❌ Disabled'}\n"
-        f"• NSFW filtering: {'✅ Enabled' if current_nsfw_filter else '❌ Disabled'}\n"
-        f"• Service messages: {'✅ Enabled' if current_service_enabled else '❌ Disabled'} (del after {current_service_del_time}s)\n"
-        f"• Event messages: {'✅ Enabled' if current_event_enabled else '❌ Disabled'} (del after {current_event_del_time}s)\n"
-        f"• Warning threshold: {current_warn_settings['threshold']} warnings\n"
-        f"• Mute duration: {current_warn_settings['mute_duration']} hours\n\n"
-        f"👆 Tap buttons above to configure settings."
+    reply_markup = _build_config_keyboard(
+        self_destruct, edit_deletion, nsfw_filter, service_enabled, event_enabled, threshold, mute_duration
     )
+    return text, reply_markup
+
+
+@require_admin(denied_text="❌ Only admins can access the configuration panel.")
+async def config_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Open configuration panel for customizing bot settings"""
+    chat_id = update.effective_chat.id
     
+    config_text, reply_markup = _build_config_panel(chat_id)
     await update.message.reply_text(config_text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
 
 
+# Comprehensive NSFW keywords including pornographic content
+NSFW_KEYWORDS = (
+    # Pornographic content and nudity
+    'porn', 'porno', 'pornography', 'xxx', 'adult', 'nude', 'naked', 'nudity',
+    'boob', 'boobs', 'tits', 'tit', 'breast', 'breasts', 'cleavage',
+    'pussy', 'vagina', 'clit', 'clitoris', 'labia', 'cunt',
+    'penis', 'dick', 'cock', 'shaft', 'member', 'wang', 'pecker',
+    'ass', 'butt', 'booty', 'arse', 'arsehole', 'anus', 'anal',
+    'sex', 'sexual', 'seduce', 'seduction', 'seductive',
+    'blowjob', 'bj', 'fellatio', 'suck', 'oral', 'rimjob', 'analingus',
+    'handjob', 'fingering', 'masturbation', 'wank', 'masturbate',
+    'orgasm', 'cum', 'ejaculate', 'jizz', 'semen', 'come',
+    'fucking', 'fucked', 'fuck', 'fucker', 'fucks', 'fck', 'fuk',
+    'horny', 'aroused', 'excited', 'kinky', 'pervert', 'perverted',
+    
+    # Porn sites and platforms
+    'xvideos', 'xhamster', 'pornhub', 'youporn', 'redtube', 'tube8',
+    'xnxx', 'spankbang', 'txxx', 'beeg', 'pornhd', 'hqporner',
+    'camgirl', 'camboy', 'webcam', 'chaturbate', 'bongacams',
+    'stripchat', 'camsoda', 'imlive', 'streamate',
+    
+    # Erotic and adult services
+    'escort', 'hooker', 'prostitute', 'whore', 'slut', 'hoe', 'thot',
+    'stripper', 'striptease', 'lapdance', 'pole dance',
+    'call girl', 'massage parlor', 'happy ending',
+    'adult dating', 'sugar daddy', 'sugar baby',
+    
+    # BDSM and fetish content
+    'bdsm', 'bondage', 'dominance', 'submission', 'dom/sub',
+    'fetish', 'kink', 'fisting', 'gangbang', 'orgy', 'swinger',
+    'master', 'mistress', 'slave', 'submissive', 'dominant',
+    'leather', 'latex', 'chains', 'cuffs', 'collar',
+    
+    # Drugs and substances
+    'weed', 'marijuana', 'cannabis', 'joint', 'bud', '420', 'ganja',
+    'cocaine', 'coke', 'crack', 'snow', 'blow', 'white',
+    'heroin', 'smack', 'brown', 'horse',
+    'meth', 'crystal', 'ice', 'speed', 'amphetamine',
+    'ecstasy', 'mdma', 'e', 'molly', 'x',
+    'lsd', 'acid', 'shrooms', 'magic mushrooms', 'psilocybin',
+    'pcp', 'angel dust', 'ketamine', 'special k',
+    'adderall', 'oxy', 'oxycodone', 'percocet', 'vicodin',
+    'xanax', 'valium', 'ativan', 'ativan', 'klonopin',
+    
+    # Violence and gore
+    'blood', 'gore', 'bloody', 'slaughter', 'massacre',
+    'murder', 'kill', 'killing', 'death', 'dead', 'corpse',
+    'suicide', 'suicidal', 'hang myself', 'shoot myself',
+    'violence', 'violent', 'brutal', 'brutality', 'torture',
+    'terrorist', 'terrorism', 'bomb', 'explode', 'explosion',
+    
+    # Offensive language and slurs
+    'bitch', 'bastard', 'damn', 'hell', 'shit', 'crap',
+    'asshole', 'dickhead', 'cockhead', 'shithead', 'fuckhead',
+    'prick', 'twat', 'minge', 'bollocks', 'knob', 'bellend',
+    'wanker', 'tosser', 'cunt', 'slag', 'slut', 'whore',
+    
+    # Racial and discriminatory slurs
+    'nigger', 'nigga', 'chink', 'gook', 'spic', 'kike',
+    'fag', 'faggot', 'queer', 'dyke', 'tranny', 'transvestite',
+    'wop', 'mick', 'cracker', 'redneck', 'hillbilly',
+    
+    # Other inappropriate content
+    'pedo', 'pedophile', 'child porn', 'cp', 'loli', 'shota',
+    'bestiality', 'zoophile', 'animal sex',
+    'incest', 'taboo', 'family sex',
+    'rape', 'rapist', 'molest', 'molestation'
+)
+
+@lru_cache(maxsize=None)
+def _nsfw_re() -> "re.Pattern[str]":
+    """Single case-insensitive alternation of NSFW_KEYWORDS, compiled on first scan rather than at startup"""
+    return re.compile(
+        "|".join(re.escape(keyword) for keyword in dict.fromkeys(NSFW_KEYWORDS)),
+        re.IGNORECASE
+    )
+
+
+_NSFW_SEPARATOR = "\u0001"  # never part of a keyword, so matches cannot span texts
+NSFW_OFFLOAD_CHARS = 10_000  # larger scans run in a worker thread
+NSFW_MAX_SCAN_CHARS = 4096  # Telegram's message length limit
+
+
 def detect_nsfw_content(text: str) -> bool:
     """Detect if text contains NSFW/inappropriate content including pornographic material"""
     if not text:
         return False
     
-    # Convert to lowercase for case-insensitive matching
-    text_lower = text.lower().strip()
-    
-    # Comprehensive NSFW keywords including pornographic content
-    nsfw_keywords = [
-        # Pornographic content and nudity
-        'porn', 'porno', 'pornography', 'xxx', 'adult', 'nude', 'naked', 'nudity',
-        'boob', 'boobs', 'tits', 'tit', 'breast', 'breasts', 'cleavage',
-        'pussy', 'vagina', 'clit', 'clitoris', 'labia', 'cunt',
-        'penis', 'dick', 'cock', 'shaft', 'member', 'wang', 'pecker',
-        'ass', 'butt', 'booty', 'arse', 'arsehole', 'anus', 'anal',
-        'sex', 'sexual', 'seduce', 'seduction', 'seductive',
-        'blowjob', 'bj', 'fellatio', 'suck', 'oral', 'rimjob', 'analingus',
-        'handjob', 'fingering', 'masturbation', 'wank', 'masturbate',
-        'orgasm', 'cum', 'ejaculate', 'jizz', 'semen', 'come',
-        'fucking', 'fucked', 'fuck', 'fucker', 'fucks', 'fck', 'fuk',
-        'horny', 'aroused', 'excited', 'kinky', 'pervert', 'perverted',
-        
-        # Porn sites and platforms
-        'xvideos', 'xhamster', 'pornhub', 'youporn', 'redtube', 'tube8',
-        'xnxx', 'spankbang', 'txxx', 'beeg', 'pornhd', 'hqporner',
-        'camgirl', 'camboy', 'webcam', 'chaturbate', 'bongacams',
-        'stripchat', 'camsoda', 'imlive', 'streamate',
-        
-        # Erotic and adult services
-        'escort', 'hooker', 'prostitute', 'whore', 'slut', 'hoe', 'thot',
-        'stripper', 'striptease', 'lapdance', 'pole dance',
-        'call girl', 'massage parlor', 'happy ending',
-        'adult dating', 'sugar daddy', 'sugar baby',
-        
-        # BDSM and fetish content
-        'bdsm', 'bondage', 'dominance', 'submission', 'dom/sub',
-        'fetish', 'kink', 'fisting', 'gangbang', 'orgy', 'swinger',
-        'master', 'mistress', 'slave', 'submissive', 'dominant',
-        'leather', 'latex', 'chains', 'cuffs', 'collar',
-        
-        # Drugs and substances
-        'weed', 'marijuana', 'cannabis', 'joint', 'bud', '420', 'ganja',
-        'cocaine', 'coke', 'crack', 'snow', 'blow', 'white',
-        'heroin', 'smack', 'brown', 'horse',
-        'meth', 'crystal', 'ice', 'speed', 'amphetamine',
-        'ecstasy', 'mdma', 'e', 'molly', 'x',
-        'lsd', 'acid', 'shrooms', 'magic mushrooms', 'psilocybin',
-        'pcp', 'angel dust', 'ketamine', 'special k',
-        'adderall', 'oxy', 'oxycodone', 'percocet', 'vicodin',
-        'xanax', 'valium', 'ativan', 'ativan', 'klonopin',
-        
-        # Violence and gore
-        'blood', 'gore', 'bloody', 'slaughter', 'massacre',
-        'murder', 'kill', 'killing', 'death', 'dead', 'corpse',
-        'suicide', 'suicidal', 'hang myself', 'shoot myself',
-        'violence', 'violent', 'brutal', 'brutality', 'torture',
-        'terrorist', 'terrorism', 'bomb', 'explode', 'explosion',
-        
-        # Offensive language and slurs
-        'bitch', 'bastard', 'damn', 'hell', 'shit', 'crap',
-        'asshole', 'dickhead', 'cockhead', 'shithead', 'fuckhead',
-        'prick', 'twat', 'minge', 'bollocks', 'knob', 'bellend',
-        'wanker', 'tosser', 'cunt', 'slag', 'slut', 'whore',
-        
-        # Racial and discriminatory slurs
-        'nigger', 'nigga', 'chink', 'gook', 'spic', 'kike',
-        'fag', 'faggot', 'queer', 'dyke', 'tranny', 'transvestite',
-        'wop', 'mick', 'cracker', 'redneck', 'hillbilly',
-        
-        # Other inappropriate content
-        'pedo', 'pedophile', 'child porn', 'cp', 'loli', 'shota',
-        'bestiality', 'zoophile', 'animal sex',
-        'incest', 'taboo', 'family sex',
-        'rape', 'rapist', 'molest', 'molestation'
-    ]
+    # endpos bounds the scan without copying oversized input
+    return _nsfw_re().search(text, 0, NSFW_MAX_SCAN_CHARS) is not None
+
+
+def detect_nsfw_content_many(texts: List[str]) -> List[bool]:
+    """Detect NSFW content in several texts with one regex pass over their joined form"""
+    joined = _NSFW_SEPARATOR.join(texts)
     
-    # Check if any NSFW keyword is in the text
-    for keyword in nsfw_keywords:
-        if keyword in text_lower:
-            return True
+    # Offset at which each text starts inside the joined string
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
     
-    return False
+    results = [False] * len(texts)
+    pos = 0
+    while True:
+        match = _nsfw_re().search(joined, pos)
+        if not match:
+            break
+        index = bisect_right(starts, match.start()) - 1
+        results[index] = True
+        # One hit is enough for a text, continue with the next one
+        if index + 1 == len(starts):
+            break
+        pos = starts[index + 1]
+    
+    return results
+
+
+async def detect_nsfw_content_many_async(texts: List[str]) -> List[bool]:
+    """Batch NSFW detection that moves large scans off the event loop"""
+    if sum(len(text) for text in texts) > NSFW_OFFLOAD_CHARS:
+        return await asyncio.get_running_loop().run_in_executor(None, detect_nsfw_content_many, texts)
+    return detect_nsfw_content_many(texts)
+
 
+# Pending message deletions: heap of (due_time, chat_id, message_id)
+_delete_heap: List[Tuple[float, int, int]] = []
+_delete_wakeup: "asyncio.Event | None" = None
+_delete_worker: "asyncio.Task | None" = None
 
-async def schedule_message_deletion(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, delay: int) -> None:
+
+async def _message_deletion_worker(bot) -> None:
+    """Single long-running task that deletes scheduled messages once they are due"""
+    while True:
+        while _delete_heap and _delete_heap[0][0] <= time.monotonic():
+            _, chat_id, message_id = heapq.heappop(_delete_heap)
+            try:
+                await bot.delete_message(chat_id, message_id)
+            except Exception:
+                pass  # Message might already be deleted
+        
+        # Sleep until the next deletion is due or an earlier one gets scheduled
+        _delete_wakeup.clear()
+        timeout = _delete_heap[0][0] - time.monotonic() if _delete_heap else None
+        try:
+            await asyncio.wait_for(_delete_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def schedule_message_deletion(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_id: int, delay: int) -> None:
     """Schedule a message for deletion after delay"""
-    await asyncio.sleep(delay)
-    try:
-        await context.bot.delete_message(chat_id, message_id)
-    except Exception:
-        pass  # Message might already be deleted
+    global _delete_wakeup, _delete_worker
+    
+    if _delete_worker is None or _delete_worker.done():
+        _delete_wakeup = asyncio.Event()
+        _delete_worker = asyncio.create_task(_message_deletion_worker(context.bot))
+    
+    heapq.heappush(_delete_heap, (time.monotonic() + delay, chat_id, message_id))
+    _delete_wakeup.set()
+
+
+# Message attributes that mark a service message (user joined, left, etc.)
+_SERVICE_ATTRS = (
+    "new_chat_members",
+    "left_chat_member",
+    "new_chat_title",
+    "new_chat_photo",
+    "delete_chat_photo",
+    "group_chat_created",
+    "supergroup_chat_created",
+    "channel_chat_created",
+    "message_auto_delete_timer_changed",
+    "pinned_message",
+    "invoice",
+    "successful_payment",
+    "connected_website",
+    "migrate_from_chat_id",
+    "migrate_to_chat_id",
+    "proximity_alert_triggered",
+    "video_chat_scheduled",
+    "video_chat_started",
+    "video_chat_ended",
+    "video_chat_participants_invited",
+)
+
+# Message attributes that mark regular user content (anything else is an event)
+_CONTENT_ATTRS = (
+    "text",
+    "caption",
+    "photo",
+    "video",
+    "sticker",
+    "animation",
+    "voice",
+    "audio",
+    "document",
+    "video_note",
+)
 
 
 async def handle_service_event_messages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2154,38 +2436,16 @@ async def handle_service_event_messages(update: Update, context: ContextTypes.DE
     chat_id = msg.chat.id
     
     # Check if it's a service message (like user joined, left, etc.)
-    is_service_message = (
-        msg.new_chat_members or 
-        msg.left_chat_member or 
-        msg.new_chat_title or 
-        msg.new_chat_photo or 
-        msg.delete_chat_photo or 
-        msg.group_chat_created or 
-        msg.supergroup_chat_created or 
-        msg.channel_chat_created or 
-        msg.message_auto_delete_timer_changed or 
-        msg.pinned_message or 
-        msg.invoice or 
-        msg.successful_payment or 
-        msg.connected_website or 
-        msg.forward_origin or 
-        msg.is_automatic_forward or 
-        msg.has_protected_content or
-        msg.migrate_from_chat_id or
-        msg.migrate_to_chat_id or
-        msg.pinned_message or
-        msg.proximity_alert_triggered or
-        msg.video_chat_scheduled or
-        msg.video_chat_started or
-        msg.video_chat_ended or
-        msg.video_chat_participants_invited
-    )
+    is_service_message = any(getattr(msg, attr, None) for attr in _SERVICE_ATTRS)
     
     if is_service_message:
         # Check if service messages are enabled for this chat
-        service_settings = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30})
+        settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+        
+        if not settings.service_configured:
+            return  # Left alone until the chat configures service messages
         
-        if not service_settings.get('enabled', True):
+        if not settings.service_enabled:
             # Service messages are disabled, delete the message
             try:
                 await msg.delete()
@@ -2193,18 +2453,21 @@ async def handle_service_event_messages(update: Update, context: ContextTypes.DE
                 pass  # Message might already be deleted
         else:
             # Service messages are enabled, check if deletion time is set
-            delete_after = service_settings.get('delete_after', 30)
+            delete_after = settings.service_del
             if delete_after > 0:
                 # Schedule deletion
-                asyncio.create_task(schedule_message_deletion(context, chat_id, msg.id, delete_after))
+                schedule_message_deletion(context, chat_id, msg.id, delete_after)
     
     # Check if it's an event message (non-content messages like contacts, locations, polls, etc.)
     # But exclude service messages and regular content
-    elif not msg.text and not msg.caption and not msg.photo and not msg.video and not msg.sticker and not msg.animation:
+    elif not any(getattr(msg, attr, None) for attr in _CONTENT_ATTRS):
         # Check if event messages are enabled for this chat
-        event_settings = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30})
+        settings = chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS)
+        
+        if not settings.event_configured:
+            return  # Left alone until the chat configures event messages
         
-        if not event_settings.get('enabled', True):
+        if not settings.event_enabled:
             # Event messages are disabled, delete the message
             try:
                 await msg.delete()
@@ -2212,10 +2475,10 @@ async def handle_service_event_messages(update: Update, context: ContextTypes.DE
                 pass  # Message might already be deleted
         else:
             # Event messages are enabled, check if deletion time is set
-            delete_after = event_settings.get('delete_after', 30)
+            delete_after = settings.event_del
             if delete_after > 0:
                 # Schedule deletion
-                asyncio.create_task(schedule_message_deletion(context, chat_id, msg.id, delete_after))
+                schedule_message_deletion(context, chat_id, msg.id, delete_after)
 
 
 async def handle_other_events(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2224,16 +2487,22 @@ async def handle_other_events(update: Update, context: ContextTypes.DEFAULT_TYPE
     pass
 
 
-async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Check messages for filter keywords and respond with media"""
+@lru_cache(maxsize=1024)
+def _keyword_pattern(keyword: str) -> "re.Pattern[str]":
+    """Case-insensitive literal pattern for a filter keyword, so message text is never lowercased"""
+    return re.compile(re.escape(keyword), re.IGNORECASE)
+
+
+async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Check messages for filter keywords and respond with media (True if removed as NSFW)"""
     msg = update.message
     if not msg:
-        return
+        return False
     
     chat_id = msg.chat.id
     
     # Check if NSFW filtering is enabled for this chat
-    if nsfw_filter_enabled.get(chat_id, False):
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).nsfw:
         # Check for text content
         text = msg.text or msg.caption or ""
         if text and detect_nsfw_content(text):
@@ -2247,8 +2516,7 @@ async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             user_id = msg.from_user.id
             count, muted = await apply_warning(context, chat_id, user_id)
             
-            name = escape(msg.from_user.first_name)
-            mention = f'<a href="tg://user?id={user_id}">{name}</a>'
+            mention = msg.from_user.mention_html(msg.from_user.first_name)
             
             if muted:
                 await context.bot.send_message(
@@ -2262,7 +2530,7 @@ async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                     f"⚠️ {mention} warned for inappropriate content. Warnings: {count}/3",
                     parse_mode=ParseMode.HTML
                 )
-            return  # Don't process filters if NSFW content detected
+            return True  # Don't process filters if NSFW content detected
         
         # Check for media content
         elif msg.photo or msg.video or msg.animation or msg.document or msg.sticker:
@@ -2278,8 +2546,7 @@ async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                 user_id = msg.from_user.id
                 count, muted = await apply_warning(context, chat_id, user_id)
                 
-                name = escape(msg.from_user.first_name)
-                mention = f'<a href="tg://user?id={user_id}">{name}</a>'
+                mention = msg.from_user.mention_html(msg.from_user.first_name)
                 
                 if muted:
                     await context.bot.send_message(
@@ -2293,18 +2560,16 @@ async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
                         f"⚠️ {mention} warned for inappropriate content. Warnings: {count}/3",
                         parse_mode=ParseMode.HTML
                     )
-                return  # Don't process filters if NSFW content detected
+                return True  # Don't process filters if NSFW content detected
     
     # Get text from message or caption for filter processing
     text = msg.text or msg.caption or ""
     if not text:
-        return
-    
-    text_lower = text.lower()
+        return False
     
     # Check all filters for this chat
-    for (filter_chat_id, keyword), data in filters_store.items():
-        if filter_chat_id == chat_id and keyword in text_lower:
+    for keyword, data in filters_store.get(chat_id, {}).items():
+        if _keyword_pattern(keyword).search(text):
             try:
                 # Send appropriate media type
                 if data['type'] == 'photo':
@@ -2333,775 +2598,545 @@ async def check_filters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             except Exception:
                 pass
             break  # Only respond to first matched filter
+    
+    return False
 
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Handle button callbacks for unmute/unban/free"""
-    query = update.callback_query
-    await query.answer()
+async def group_message_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Run every check on a new group message from one handler, stopping once it is removed"""
+    msg = update.message
+    if not msg:
+        return
     
-    chat_id = query.message.chat.id
-    admin_id = query.from_user.id
+    # Keyword filters and NSFW text (commands other bots handle are skipped)
+    if msg.text and not msg.text.startswith('/'):
+        if await check_filters(update, context):
+            return
     
-    # Check if user is admin
-    if not await is_admin(context, chat_id, admin_id):
-        await query.answer("❌ Only admins can use this button.", show_alert=True)
+    # Link detection (entities first, then a plain-text fallback for links Telegram did not mark)
+    if await delete_links(update, context):
         return
     
-    # Parse callback data
-    parts = query.data.split("_")
-    action = parts[0]
+    # Content restrictions from /free (stickers, GIFs, NSFW media, ...)
+    if await check_message_content(update, context):
+        return
+    
+    # Service and event messages
+    await handle_service_event_messages(update, context)
+
+
+# Debounced config panel edits: {(chat_id, message_id): task}
+_pending_edits: Dict[Tuple[int, int], "asyncio.Task"] = {}
+PANEL_EDIT_DEBOUNCE = 0.2  # seconds to wait for more clicks before editing
+
+# Last text shown on each config panel, to skip edits that change nothing: {(chat_id, message_id): text}
+_last_panel: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+LAST_PANEL_MAX_SIZE = 4096
+
+
+async def _delayed_panel_edit(query, chat_id: int, message: str) -> None:
+    """Wait for rapid clicks to settle, then show the panel with the latest settings"""
+    await asyncio.sleep(PANEL_EDIT_DEBOUNCE)
+    key = (chat_id, query.message.message_id)
+    if _pending_edits.get(key) is asyncio.current_task():
+        del _pending_edits[key]  # From here on a new click schedules a fresh edit
+    
+    text, reply_markup = _build_config_panel(chat_id, message)
+    if _last_panel.get(key) == text:
+        _last_panel.move_to_end(key)
+        return  # Already showing this panel (e.g. another admin made the same change)
     
     try:
-        if action == "config":
-            # Handle configuration button clicks
-            config_action = parts[1] if len(parts) > 1 else ""
-            
-            if config_action == "selfdestruct":
-                # Prompt for self-destruct timer
-                await query.edit_message_text(
-                    "⏰ *Self-Destruct Timer Configuration*\n\n"
-                    "Please use the command:\n"
-                    "`/setselfdestruct <seconds>`\n\n"
-                    "Example: `/setselfdestruct 30` for 30 seconds\n"
-                    "Or `/resetselfdestruct` to disable",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "editdel":
-                # Toggle edit deletion
-                if chat_id in edit_deletion_enabled:
-                    del edit_deletion_enabled[chat_id]
-                    status = "❌ Disabled"
-                    message = "✅ Edit deletion has been disabled."
-                else:
-                    edit_deletion_enabled[chat_id] = True
-                    status = "✅ Enabled"
-                    message = "✅ Edit deletion has been enabled."
-                
-                # Update the message with new status
-                current_self_destruct = self_destruct_timers.get(chat_id, 0)
-                current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-                current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-                current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-                
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Self-destruct: {current_self_destruct}s", 
-                            callback_data="config_selfdestruct"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_edit_deletion else '❌'} Edit Del", 
-                            callback_data="config_editdel"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_nsfw_filter else '❌'} NSFW Filter", 
-                            callback_data="config_nsfw"
-                        ),
-                        InlineKeyboardButton(
-                            f"⚠️ Warn: {current_warn_settings['threshold']}", 
-                            callback_data="config_warn"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Mute: {current_warn_settings['mute_duration']}h", 
-                            callback_data="config_mutedur"
-                        ),
-                        InlineKeyboardButton(
-                            "🔄 Reload Config", 
-                            callback_data="config_reload"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "📋 View All Settings", 
-                            callback_data="config_viewall"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"⚙️ *Bot Configuration Panel*\n\n"
-                    f"*Current Settings for this Group:*\n"
-                    f"• Self-destruct timer: {current_self_destruct}s {'✅ On' if current_self_destruct > 0 else '❌ Off'}\n"
-                    f"• Edit deletion: {status}\n"
-                    f"• NSFW filtering: {'✅ Enabled' if current_nsfw_filter else '❌ Disabled'}\n"
-                    f"• Warning threshold: {current_warn_settings['threshold']} warnings\n"
-                    f"• Mute duration: {current_warn_settings['mute_duration']} hours\n\n"
-                    f"👆 Tap buttons above to configure settings.\n\n"
-                    f"{message}",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "nsfw":
-                # Toggle NSFW filtering
-                if chat_id in nsfw_filter_enabled:
-                    del nsfw_filter_enabled[chat_id]
-                    status = "❌ Disabled"
-                    message = "✅ NSFW filtering has been disabled."
-                else:
-                    nsfw_filter_enabled[chat_id] = True
-                    status = "✅ Enabled"
-                    message = "✅ NSFW filtering has been enabled."
-                
-                # Update the message with new status
-                current_self_destruct = self_destruct_timers.get(chat_id, 0)
-                current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-                current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-                current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-                
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Self-destruct: {current_self_destruct}s", 
-                            callback_data="config_selfdestruct"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_edit_deletion else '❌'} Edit Del", 
-                            callback_data="config_editdel"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_nsfw_filter else '❌'} NSFW Filter", 
-                            callback_data="config_nsfw"
-                        ),
-                        InlineKeyboardButton(
-                            f"⚠️ Warn: {current_warn_settings['threshold']}", 
-                            callback_data="config_warn"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Mute: {current_warn_settings['mute_duration']}h", 
-                            callback_data="config_mutedur"
-                        ),
-                        InlineKeyboardButton(
-                            "🔄 Reload Config", 
-                            callback_data="config_reload"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "📋 View All Settings", 
-                            callback_data="config_viewall"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"⚙️ *Bot Configuration Panel*\n\n"
-                    f"*Current Settings for this Group:*\n"
-                    f"• Self-destruct timer: {current_self_destruct}s {'✅ On' if current_self_destruct > 0 else '❌ Off'}\n"
-                    f"• Edit deletion: {'✅ Enabled' if current_edit_deletion else '❌ Disabled'}\n"
-                    f"• NSFW filtering: {status}\n"
-                    f"• Warning threshold: {current_warn_settings['threshold']} warnings\n"
-                    f"• Mute duration: {current_warn_settings['mute_duration']} hours\n\n"
-                    f"👆 Tap buttons above to configure settings.\n\n"
-                    f"{message}",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "service":
-                # Toggle service message settings
-                if chat_id in service_msg_settings:
-                    current_state = service_msg_settings[chat_id]['enabled']
-                    service_msg_settings[chat_id]['enabled'] = not current_state
-                    status = "✅ Enabled" if not current_state else "❌ Disabled"
-                    message = f"✅ Service messages have been {'enabled' if not current_state else 'disabled'}!"
-                else:
-                    service_msg_settings[chat_id] = {'enabled': True, 'delete_after': 30}
-                    status = "✅ Enabled"
-                    message = "✅ Service messages have been enabled!"
-                
-                # Update the message with new status
-                current_self_destruct = self_destruct_timers.get(chat_id, 0)
-                current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-                current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-                current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-                current_service_enabled = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_service_del_time = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                current_event_enabled = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_event_del_time = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Self-destruct: {current_self_destruct}s", 
-                            callback_data="config_selfdestruct"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_edit_deletion else '❌'} Edit Del", 
-                            callback_data="config_editdel"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_nsfw_filter else '❌'} NSFW Filter", 
-                            callback_data="config_nsfw"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_service_enabled else '❌'} Service", 
-                            callback_data="config_service"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_event_enabled else '❌'} Event", 
-                            callback_data="config_event"
-                        ),
-                        InlineKeyboardButton(
-                            f"⚠️ Warn: {current_warn_settings['threshold']}", 
-                            callback_data="config_warn"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Mute: {current_warn_settings['mute_duration']}h", 
-                            callback_data="config_mutedur"
-                        ),
-                        InlineKeyboardButton(
-                            "🔄 Reload Config", 
-                            callback_data="config_reload"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "📋 View All Settings", 
-                            callback_data="config_viewall"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"⚙️ *Bot Configuration Panel*\n\n"
-                    f"*Current Settings for this Group:*\n"
-                    f"• Self-destruct timer: {current_self_destruct}s {'✅ On' if current_self_destruct > 0 else '❌ Off'}\n"
-                    f"• Edit deletion: {'✅ Enabled' if current_edit_deletion else '❌ Disabled'}\n"
-                    f"• NSFW filtering: {'✅ Enabled' if current_nsfw_filter else '❌ Disabled'}\n"
-                    f"• Service messages: {status} (del after {current_service_del_time}s)\n"
-                    f"• Event messages: {'✅ Enabled' if current_event_enabled else '❌ Disabled'} (del after {current_event_del_time}s)\n"
-                    f"• Warning threshold: {current_warn_settings['threshold']} warnings\n"
-                    f"• Mute duration: {current_warn_settings['mute_duration']} hours\n\n"
-                    f"👆 Tap buttons above to configure settings.\n\n"
-                    f"{message}",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "event":
-                # Toggle event message settings
-                if chat_id in event_msg_settings:
-                    current_state = event_msg_settings[chat_id]['enabled']
-                    event_msg_settings[chat_id]['enabled'] = not current_state
-                    status = "✅ Enabled" if not current_state else "❌ Disabled"
-                    message = f"✅ Event messages have been {'enabled' if not current_state else 'disabled'}!"
-                else:
-                    event_msg_settings[chat_id] = {'enabled': True, 'delete_after': 30}
-                    status = "✅ Enabled"
-                    message = "✅ Event messages have been enabled!"
-                
-                # Update the message with new status
-                current_self_destruct = self_destruct_timers.get(chat_id, 0)
-                current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-                current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-                current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-                current_service_enabled = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_service_del_time = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                current_event_enabled = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_event_del_time = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Self-destruct: {current_self_destruct}s", 
-                            callback_data="config_selfdestruct"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_edit_deletion else '❌'} Edit Del", 
-                            callback_data="config_editdel"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_nsfw_filter else '❌'} NSFW Filter", 
-                            callback_data="config_nsfw"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if current_service_enabled else '❌'} Service", 
-                            callback_data="config_service"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if current_event_enabled else '❌'} Event", 
-                            callback_data="config_event"
-                        ),
-                        InlineKeyboardButton(
-                            f"⚠️ Warn: {current_warn_settings['threshold']}", 
-                            callback_data="config_warn"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"⏰ Mute: {current_warn_settings['mute_duration']}h", 
-                            callback_data="config_mutedur"
-                        ),
-                        InlineKeyboardButton(
-                            "🔄 Reload Config", 
-                            callback_data="config_reload"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "📋 View All Settings", 
-                            callback_data="config_viewall"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"⚙️ *Bot Configuration Panel*\n\n"
-                    f"*Current Settings for this Group:*\n"
-                    f"• Self-destruct timer: {current_self_destruct}s {'✅ On' if current_self_destruct > 0 else '❌ Off'}\n"
-                    f"• Edit deletion: {'✅ Enabled' if current_edit_deletion else '❌ Disabled'}\n"
-                    f"• NSFW filtering: {'✅ Enabled' if current_nsfw_filter else '❌ Disabled'}\n"
-                    f"• Service messages: {'✅ Enabled' if current_service_enabled else '❌ Disabled'} (del after {current_service_del_time}s)\n"
-                    f"• Event messages: {status} (del after {current_event_del_time}s)\n"
-                    f"• Warning threshold: {current_warn_settings['threshold']} warnings\n"
-                    f"• Mute duration: {current_warn_settings['mute_duration']} hours\n\n"
-                    f"👆 Tap buttons above to configure settings.\n\n"
-                    f"{message}",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "warn":
-                # Prompt for warning threshold
-                await query.edit_message_text(
-                    "⚠️ *Warning Threshold Configuration*\n\n"
-                    "Please use the command:\n"
-                    "`/setwarnlimit <number>`\n\n"
-                    "Example: `/setwarnlimit 5` for 5 warnings before mute\n"
-                    "Default: 3 warnings",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "mutedur":
-                # Prompt for mute duration
-                await query.edit_message_text(
-                    "⏰ *Mute Duration Configuration*\n\n"
-                    "Please use the command:\n"
-                    "`/setmutetime <hours>`\n\n"
-                    "Example: `/setmutetime 48` for 48 hours mute\n"
-                    "Default: 24 hours",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            elif config_action == "reload":
-                # Reload configuration
-                active_configs = {
-                    "Self-destruct timers": len([k for k, v in self_destruct_timers.items() if v > 0]),
-                    "Edit deletion": len([k for k, v in edit_deletion_enabled.items() if v]),
-                    "NSFW filtering": len([k for k, v in nsfw_filter_enabled.items() if v]),
-                    "Warning settings": len(warning_settings),
-                    "Service messages": len([k for k, v in service_msg_settings.items() if v['enabled']]),
-                    "Event messages": len([k for k, v in event_msg_settings.items() if v['enabled']]),
-                    "Filters": len([k for k, v in filters_store.items()])
-                }
-                
-                total_active = sum(active_configs.values())
-                
-                config_text = "🔄 *Configuration Reloaded Successfully!*\n\n*Active Configurations:*\n"
-                
-                for config, count in active_configs.items():
-                    if count > 0:
-                        config_text += f"• {config}: {count} active\n"
-                
-                if total_active == 0:
-                    config_text += "• No active configurations found\n"
-                
-                config_text += "\n✅ Bot configuration has been refreshed."
-                
-                await query.edit_message_text(config_text, parse_mode=ParseMode.MARKDOWN)
-            elif config_action == "viewall":
-                # Show all settings in detail
-                current_self_destruct = self_destruct_timers.get(chat_id, 0)
-                current_edit_deletion = edit_deletion_enabled.get(chat_id, False)
-                current_nsfw_filter = nsfw_filter_enabled.get(chat_id, False)
-                current_warn_settings = warning_settings.get(chat_id, {'threshold': 3, 'mute_duration': 24})
-                current_service_enabled = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_service_del_time = service_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                current_event_enabled = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('enabled', True)
-                current_event_del_time = event_msg_settings.get(chat_id, {'enabled': True, 'delete_after': 30}).get('delete_after', 30)
-                
-                settings_text = (
-                    f"📋 *Detailed Configuration Settings*\n\n"
-                    f"*Self-Destruct Timer:*\n"
-                    f"  - Current: {current_self_destruct}s ({'Enabled' if current_self_destruct > 0 else 'Disabled'})\n"
-                    f"  - Command: `/setselfdestruct <seconds>`\n\n"
-                    f"*Edit Deletion:*\n"
-                    f"  - Current: {'Enabled' if current_edit_deletion else 'Disabled'}\n"
-                    f"  - Commands: `/enableedit` / `/disableedit`\n\n"
-                    f"*NSFW Filtering:*\n"
-                    f"  - Current: {'Enabled' if current_nsfw_filter else 'Disabled'}\n"
-                    f"  - Commands: `/enablensfw` / `/disablensfw`\n\n"
-                    f"*Service Messages:*\n"
-                    f"  - Current: {'Enabled' if current_service_enabled else 'Disabled'}\n"
-                    f"  - Deletion time: {current_service_del_time}s\n"
-                    f"  - Commands: `/enable_service` / `/disable_service`, `/set_service_del_time <seconds>`\n\n"
-                    f"*Event Messages:*\n"
-                    f"  - Current: {'Enabled' if current_event_enabled else 'Disabled'}\n"
-                    f"  - Deletion time: {current_event_del_time}s\n"
-                    f"  - Commands: `/enable_event` / `/disable_event`, `/set_event_del_time <seconds>`\n\n"
-                    f"*Warning Settings:*\n"
-                    f"  - Threshold: {current_warn_settings['threshold']} warnings\n"
-                    f"  - Mute Duration: {current_warn_settings['mute_duration']} hours\n"
-                    f"  - Commands: `/setwarnlimit <num>` / `/setmutetime <hours>`\n\n"
-                    f"*Other Commands:*\n"
-                    f"  - `/reload` - Refresh configuration\n"
-                    f"  - `/config` - Return to config panel\n"
-                    f"  - `/resetselfdestruct` - Disable self-destruct\n\n"
-                    f"👆 Use the commands above to adjust settings."
-                )
-                
-                await query.edit_message_text(settings_text, parse_mode=ParseMode.MARKDOWN)
-            else:
-                await query.answer("Configuration option not implemented yet.", show_alert=True)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=_MD)
+    except Exception:
+        return  # Message might be deleted or already show this panel
+    
+    _last_panel[key] = text
+    _last_panel.move_to_end(key)
+    if len(_last_panel) > LAST_PANEL_MAX_SIZE:
+        _last_panel.popitem(last=False)
+
+
+def cancel_panel_edit(query, chat_id: int) -> None:
+    """Drop a config panel's pending refresh, before the message is edited right away"""
+    key = (chat_id, query.message.message_id)
+    pending = _pending_edits.pop(key, None)
+    if pending is not None:
+        pending.cancel()
+    _last_panel.pop(key, None)  # The message no longer shows the panel
+
+
+def schedule_panel_edit(query, chat_id: int, message: str) -> None:
+    """Refresh a config panel after a toggle, coalescing rapid clicks into one edit"""
+    key = (chat_id, query.message.message_id)
+    pending = _pending_edits.get(key)
+    if pending is not None:
+        pending.cancel()
+    _pending_edits[key] = asyncio.create_task(_delayed_panel_edit(query, chat_id, message))
+
+
+async def _handle_selfdestruct(query, chat_id: int) -> None:
+    """Prompt for self-destruct timer"""
+    cancel_panel_edit(query, chat_id)
+    await query.edit_message_text(
+        "⏰ *Self-Destruct Timer Configuration*\n\n"
+        "Please use the command:\n"
+        "`/setselfdestruct <seconds>`\n\n"
+        "Example: `/setselfdestruct 30` for 30 seconds\n"
+        "Or `/resetselfdestruct` to disable",
+        parse_mode=_MD
+    )
+
+
+async def _handle_editdel(query, chat_id: int) -> None:
+    """Toggle edit deletion"""
+    enabled = toggle_chat_setting(chat_id, 'edit_del')
+    message = f"✅ Edit deletion has been {'enabled' if enabled else 'disabled'}."
+    
+    # Update the message with new status
+    schedule_panel_edit(query, chat_id, message)
+
+
+async def _handle_nsfw(query, chat_id: int) -> None:
+    """Toggle NSFW filtering"""
+    enabled = toggle_chat_setting(chat_id, 'nsfw')
+    message = f"✅ NSFW filtering has been {'enabled' if enabled else 'disabled'}."
+    
+    # Update the message with new status
+    schedule_panel_edit(query, chat_id, message)
+
+
+async def _handle_service(query, chat_id: int) -> None:
+    """Toggle service message settings"""
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).service_configured:
+        enabled = toggle_chat_setting(chat_id, 'service_enabled')
+    else:
+        # Shown as not configured, so the first click turns them on
+        enabled = update_chat_settings(chat_id, service_enabled=True).service_enabled
+    message = f"✅ Service messages have been {'enabled' if enabled else 'disabled'}!"
+    
+    # Update the message with new status
+    schedule_panel_edit(query, chat_id, message)
+
+
+async def _handle_event(query, chat_id: int) -> None:
+    """Toggle event message settings"""
+    if chat_settings.get(chat_id, _DEFAULT_CHAT_SETTINGS).event_configured:
+        enabled = toggle_chat_setting(chat_id, 'event_enabled')
+    else:
+        # Shown as not configured, so the first click turns them on
+        enabled = update_chat_settings(chat_id, event_enabled=True).event_enabled
+    message = f"✅ Event messages have been {'enabled' if enabled else 'disabled'}!"
+    
+    # Update the message with new status
+    schedule_panel_edit(query, chat_id, message)
+
+
+async def _handle_warn(query, chat_id: int) -> None:
+    """Prompt for warning threshold"""
+    cancel_panel_edit(query, chat_id)
+    await query.edit_message_text(
+        "⚠️ *Warning Threshold Configuration*\n\n"
+        "Please use the command:\n"
+        "`/setwarnlimit <number>`\n\n"
+        "Example: `/setwarnlimit 5` for 5 warnings before mute\n"
+        "Default: 3 warnings",
+        parse_mode=_MD
+    )
+
+
+async def _handle_mutedur(query, chat_id: int) -> None:
+    """Prompt for mute duration"""
+    cancel_panel_edit(query, chat_id)
+    await query.edit_message_text(
+        "⏰ *Mute Duration Configuration*\n\n"
+        "Please use the command:\n"
+        "`/setmutetime <hours>`\n\n"
+        "Example: `/setmutetime 48` for 48 hours mute\n"
+        "Default: 24 hours",
+        parse_mode=_MD
+    )
+
+
+async def _handle_reload(query, chat_id: int) -> None:
+    """Reload configuration"""
+    active_configs = {
+        "Self-destruct timers": _active_counts['self_destruct'],
+        "Edit deletion": _active_counts['edit_del'],
+        "NSFW filtering": _active_counts['nsfw'],
+        "Warning settings": _active_counts['warn'],
+        "Service messages": _active_counts['service'],
+        "Event messages": _active_counts['event'],
+        "Filters": _active_counts['filters']
+    }
+    
+    total_active = sum(active_configs.values())
+    
+    config_text = "🔄 *Configuration Reloaded Successfully!*\n\n*Active Configurations:*\n"
+    
+    for config, count in active_configs.items():
+        if count > 0:
+            config_text += f"• {config}: {count} active\n"
+    
+    if total_active == 0:
+        config_text += "• No active configurations found\n"
+    
+    config_text += "\n✅ Bot configuration has been refreshed."
+    
+    cancel_panel_edit(query, chat_id)
+    await query.edit_message_text(config_text, parse_mode=_MD)
+
+
+# Detailed settings text shown by the "View All Settings" button
+_VIEWALL_TEXT = (
+    "📋 *Detailed Configuration Settings*\n\n"
+    "*Self-Destruct Timer:*\n"
+    "  - Current: {self_destruct}s ({self_destruct_status})\n"
+    "  - Command: `/setselfdestruct <seconds>`\n\n"
+    "*Edit Deletion:*\n"
+    "  - Current: {edit_status}\n"
+    "  - Commands: `/enableedit` / `/disableedit`\n\n"
+    "*NSFW Filtering:*\n"
+    "  - Current: {nsfw_status}\n"
+    "  - Commands: `/enablensfw` / `/disablensfw`\n\n"
+    "*Service Messages:*\n"
+    "  - Current: {service_status}\n"
+    "  - Deletion time: {service_del}s\n"
+    "  - Commands: `/enable_service` / `/disable_service`, `/set_service_del_time <seconds>`\n\n"
+    "*Event Messages:*\n"
+    "  - Current: {event_status}\n"
+    "  - Deletion time: {event_del}s\n"
+    "  - Commands: `/enable_event` / `/disable_event`, `/set_event_del_time <seconds>`\n\n"
+    "*Warning Settings:*\n"
+    "  - Threshold: {threshold} warnings\n"
+    "  - Mute Duration: {mute_duration} hours\n"
+    "  - Commands: `/setwarnlimit <num>` / `/setmutetime <hours>`\n\n"
+    "*Other Commands:*\n"
+    "  - `/reload` - Refresh configuration\n"
+    "  - `/config` - Return to config panel\n"
+    "  - `/resetselfdestruct` - Disable self-destruct\n\n"
+    "👆 Use the commands above to adjust settings."
+)
+
+
+@lru_cache(maxsize=512)
+def _build_viewall_text(self_destruct: int, edit_deletion: bool, nsfw_filter: bool, service_enabled: bool | None,
+                        service_del: int, event_enabled: bool | None, event_del: int, threshold: int,
+                        mute_duration: int) -> str:
+    """Detailed settings text, shared between chats with the same settings"""
+    return _VIEWALL_TEXT.format(
+        self_destruct=self_destruct,
+        self_destruct_status='Enabled' if self_destruct > 0 else 'Disabled',
+        edit_status='Enabled' if edit_deletion else 'Disabled',
+        nsfw_status='Enabled' if nsfw_filter else 'Disabled',
+        service_status='Not configured' if service_enabled is None else 'Enabled' if service_enabled else 'Disabled',
+        service_del=service_del,
+        event_status='Not configured' if event_enabled is None else 'Enabled' if event_enabled else 'Disabled',
+        event_del=event_del,
+        threshold=threshold,
+        mute_duration=mute_duration,
+    )
+
+
+async def _handle_viewall(query, chat_id: int) -> None:
+    """Show all settings in detail"""
+    settings_text = _build_viewall_text(*_panel_state(chat_id))
+    cancel_panel_edit(query, chat_id)
+    await query.edit_message_text(settings_text, parse_mode=_MD)
+
+
+async def _handle_unknown_config(query, chat_id: int) -> bool:
+    """Fallback for configuration buttons without a handler"""
+    await query.answer("Configuration option not implemented yet.", show_alert=True)
+    return True
+
+
+# Configuration button handlers: {config_action: handler(query, chat_id)}
+# (handlers that answer the query themselves return True)
+_CONFIG_HANDLERS = {
+    "selfdestruct": _handle_selfdestruct,
+    "editdel": _handle_editdel,
+    "nsfw": _handle_nsfw,
+    "service": _handle_service,
+    "event": _handle_event,
+    "warn": _handle_warn,
+    "mutedur": _handle_mutedur,
+    "reload": _handle_reload,
+    "viewall": _handle_viewall,
+}
+
+
+async def _handle_config(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> bool | None:
+    """Handle configuration button clicks"""
+    return await _CONFIG_HANDLERS.get(sub, _handle_unknown_config)(query, chat_id)
+
+
+async def _handle_banstatus(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> bool | None:
+    """Toggle a user's ban status from the ban manager"""
+    target_id = int(sub)
+    new_status = tail
+    
+    if new_status == "banned":
+        # Already banned, do nothing
+        await query.answer("ℹ️ User is already banned.", show_alert=True)
+        return True
+    else:
+        # Unban the user
+        _forget_applied(chat_id, target_id)
+        await context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True)
         
-        elif action == "banstatus":
-            target_id = int(parts[1])
-            new_status = parts[2]
-            
-            if new_status == "banned":
-                # Already banned, do nothing
-                await query.answer("ℹ️ User is already banned.", show_alert=True)
-            else:
-                # Unban the user
-                await context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True)
-                
-                # Update button to show new status
-                keyboard = [[
-                    InlineKeyboardButton("❌ Banned", callback_data=f"banstatus_{target_id}_banned"),
-                    InlineKeyboardButton("✅ Unbanned", callback_data=f"banstatus_{target_id}_unbanned")
-                ]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"🔨 *Ban Status Manager*\n\nUser ID: `{target_id}`\n\nCurrent Status: ✅ Unbanned\n\nClick to toggle:",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        # Update button to show new status
+        keyboard = [[
+            InlineKeyboardButton("❌ Banned", callback_data=f"banstatus_{target_id}_banned"),
+            InlineKeyboardButton("✅ Unbanned", callback_data=f"banstatus_{target_id}_unbanned")
+        ]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        elif action == "mutestatus":
-            target_id = int(parts[1])
-            new_status = parts[2]
-            
-            if new_status == "muted":
-                # Already muted, do nothing
-                await query.answer("ℹ️ User is already muted.", show_alert=True)
-            else:
-                # Unmute the user
-                perms = ChatPermissions(
-                    can_send_messages=True,
-                    can_send_audios=True,
-                    can_send_documents=True,
-                    can_send_photos=True,
-                    can_send_videos=True,
-                    can_send_video_notes=True,
-                    can_send_voice_notes=True,
-                    can_send_polls=True,
-                    can_add_web_page_previews=True
-                )
-                await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
-                
-                # Update button to show new status
-                keyboard = [[
-                    InlineKeyboardButton("❌ Muted", callback_data=f"mutestatus_{target_id}_muted"),
-                    InlineKeyboardButton("✅ Unmuted", callback_data=f"mutestatus_{target_id}_unmuted")
-                ]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"🔇 *Mute Status Manager*\n\nUser ID: `{target_id}`\n\nCurrent Status: ✅ Unmuted\n\nClick to toggle:",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        await query.edit_message_text(
+            f"🔨 *Ban Status Manager*\n\nUser ID: `{target_id}`\n\nCurrent Status: ✅ Unbanned\n\nClick to toggle:",
+            reply_markup=reply_markup,
+            parse_mode=_MD
+        )
+
+
+async def _handle_mutestatus(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> bool | None:
+    """Toggle a user's mute status from the mute manager"""
+    target_id = int(sub)
+    new_status = tail
+    
+    if new_status == "muted":
+        # Already muted, do nothing
+        await query.answer("ℹ️ User is already muted.", show_alert=True)
+        return True
+    else:
+        # Unmute the user
+        _forget_applied(chat_id, target_id)
+        await context.bot.restrict_chat_member(chat_id, target_id, permissions=_PERMS_UNMUTED)
         
-        elif action == "unban":
-            target_id = int(parts[1])
-            await context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True)
-            await query.edit_message_text("✅ User has been unbanned.")
-            
-        elif action == "unmute":
-            target_id = int(parts[1])
-            perms = ChatPermissions(
-                can_send_messages=True,
-                can_send_audios=True,
-                can_send_documents=True,
-                can_send_photos=True,
-                can_send_videos=True,
-                can_send_video_notes=True,
-                can_send_voice_notes=True,
-                can_send_polls=True,
-                can_add_web_page_previews=True
+        # Update button to show new status
+        keyboard = [[
+            InlineKeyboardButton("❌ Muted", callback_data=f"mutestatus_{target_id}_muted"),
+            InlineKeyboardButton("✅ Unmuted", callback_data=f"mutestatus_{target_id}_unmuted")
+        ]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(
+            f"🔇 *Mute Status Manager*\n\nUser ID: `{target_id}`\n\nCurrent Status: ✅ Unmuted\n\nClick to toggle:",
+            reply_markup=reply_markup,
+            parse_mode=_MD
+        )
+
+
+async def _handle_unban(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> None:
+    """Unban a user"""
+    target_id = int(sub)
+    _forget_applied(chat_id, target_id)
+    await context.bot.unban_chat_member(chat_id, target_id, only_if_banned=True)
+    await query.edit_message_text("✅ User has been unbanned.")
+
+
+async def _handle_unmute(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> None:
+    """Unmute a user"""
+    target_id = int(sub)
+    _forget_applied(chat_id, target_id)
+    await context.bot.restrict_chat_member(chat_id, target_id, permissions=_PERMS_UNMUTED)
+    await query.edit_message_text("✅ User has been unmuted.")
+
+
+async def _handle_action_warn(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, target_id: int) -> bool:
+    """Apply warning"""
+    count, muted = await apply_warning(context, chat_id, target_id)
+    
+    if muted:
+        await query.answer("⚠️ User warned and auto-muted for 24h (3 warnings)!", show_alert=True)
+    else:
+        await query.answer(f"⚠️ User warned! Warnings: {count}/3", show_alert=True)
+    return True
+
+
+async def _handle_action_mute(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, target_id: int) -> bool:
+    """Mute user"""
+    _forget_applied(chat_id, target_id)
+    await context.bot.restrict_chat_member(chat_id, target_id, permissions=_PERMS_MUTED)
+    await query.answer("🔇 User has been muted!", show_alert=True)
+    return True
+
+
+async def _handle_action_ban(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, target_id: int) -> bool:
+    """Ban user"""
+    _forget_applied(chat_id, target_id)
+    await context.bot.ban_chat_member(chat_id, target_id)
+    await query.answer("🔨 User has been banned!", show_alert=True)
+    return True
+
+
+async def _handle_action_permissions(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, target_id: int) -> None:
+    """Show permissions panel (same as /free command)"""
+    restrictions = await user_restrictions.setdefault(chat_id, target_id)
+    
+    # Create inline keyboard with toggle buttons
+    reply_markup = make_restriction_kb(target_id, restrictions)
+    
+    await query.edit_message_text(
+        f"🔧 *Restriction Manager*\n\n"
+        f"User ID: `{target_id}`\n\n"
+        f"Toggle restrictions:\n"
+        f"✅ = Restricted | ❌ = Allowed\n\n"
+        f"Click 'Save & Apply' when done.",
+        reply_markup=reply_markup,
+        parse_mode=_MD
+    )
+
+
+# User action button handlers: {action_type: handler(query, context, chat_id, target_id)}
+# (handlers that answer the query themselves return True)
+_USER_ACTION_HANDLERS = {
+    "warn": _handle_action_warn,
+    "mute": _handle_action_mute,
+    "ban": _handle_action_ban,
+    "permissions": _handle_action_permissions,
+}
+
+
+async def _handle_action(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> bool | None:
+    """Handle the warn/mute/ban/permissions buttons"""
+    target_id = int(sub)
+    handler = _USER_ACTION_HANDLERS.get(tail)
+    if handler:
+        return await handler(query, context, chat_id, target_id)
+
+
+async def _handle_free(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, sub: str, tail: str) -> None:
+    """Toggle and apply restrictions from the restriction manager"""
+    target_id = int(sub)
+    
+    # A new user starts out unrestricted
+    restrictions, perms = compute_toggle(await user_restrictions.get(chat_id, target_id) or 0, tail)
+    
+    if perms is not None:
+        # Apply the restrictions
+        key = (chat_id, target_id)
+        if _applied_mask.get(key) == restrictions:
+            await query.edit_message_text("✅ No changes to apply.")
+            return
+        
+        await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
+        _applied_mask[key] = restrictions
+        
+        if restrictions:
+            # Build restriction summary
+            active = [name.title() for name, bit in _BITS.items() if restrictions & bit]
+            await query.edit_message_text(
+                f"✅ Restrictions applied!\n\n"
+                f"Active restrictions: {', '.join(active) if active else 'None'}\n\n"
+                f"User ID: {target_id}"
             )
-            await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
-            await query.edit_message_text("✅ User has been unmuted.")
-            
-        elif action == "action":
-            target_id = int(parts[1])
-            action_type = parts[2]
-            
-            if action_type == "warn":
-                # Apply warning
-                count, muted = await apply_warning(context, chat_id, target_id)
-                
-                if muted:
-                    await query.answer("⚠️ User warned and auto-muted for 24h (3 warnings)!", show_alert=True)
-                else:
-                    await query.answer(f"⚠️ User warned! Warnings: {count}/3", show_alert=True)
-                    
-            elif action_type == "mute":
-                # Mute user
-                perms = ChatPermissions(
-                    can_send_messages=False,
-                    can_send_audios=False,
-                    can_send_documents=False,
-                    can_send_photos=False,
-                    can_send_videos=False,
-                    can_send_video_notes=False,
-                    can_send_voice_notes=False,
-                    can_send_polls=False,
-                    can_add_web_page_previews=False
-                )
-                await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
-                await query.answer("🔇 User has been muted!", show_alert=True)
-                
-            elif action_type == "ban":
-                # Ban user
-                await context.bot.ban_chat_member(chat_id, target_id)
-                await query.answer("🔨 User has been banned!", show_alert=True)
-                
-            elif action_type == "permissions":
-                # Show permissions panel (same as /free command)
-                key = (chat_id, target_id)
-                if key not in user_restrictions:
-                    user_restrictions[key] = {
-                        'flood': False,
-                        'spam': False,
-                        'media': False,
-                        'checks': False,
-                        'night': False,
-                        'sticker': False,
-                        'gif': False,
-                        'link': False
-                    }
-                
-                restrictions = user_restrictions[key]
-                
-                # Create inline keyboard with toggle buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['flood'] else '❌'} Flood",
-                            callback_data=f"free_{target_id}_flood"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['spam'] else '❌'} Spam",
-                            callback_data=f"free_{target_id}_spam"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['media'] else '❌'} Media",
-                            callback_data=f"free_{target_id}_media"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['checks'] else '❌'} Checks",
-                            callback_data=f"free_{target_id}_checks"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['sticker'] else '❌'} Sticker",
-                            callback_data=f"free_{target_id}_sticker"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['gif'] else '❌'} GIF",
-                            callback_data=f"free_{target_id}_gif"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['link'] else '❌'} Link",
-                            callback_data=f"free_{target_id}_link"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['night'] else '❌'} Silence/Night",
-                            callback_data=f"free_{target_id}_night"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "💾 Save & Apply",
-                            callback_data=f"free_{target_id}_apply"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await query.edit_message_text(
-                    f"🔧 *Restriction Manager*\n\n"
-                    f"User ID: `{target_id}`\n\n"
-                    f"Toggle restrictions:\n"
-                    f"✅ = Restricted | ❌ = Allowed\n\n"
-                    f"Click 'Save & Apply' when done.",
-                    reply_markup=reply_markup,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        else:
+            await query.edit_message_text(f"✅ All restrictions removed!\n\nUser ID: {target_id}")
+    else:
+        # Store the toggled restriction
+        await user_restrictions.set(chat_id, target_id, restrictions)
         
-        elif action == "free":
-            target_id = int(parts[1])
-            restriction_type = parts[2]
-            
-            key = (chat_id, target_id)
-            
-            # Initialize if not exists
-            if key not in user_restrictions:
-                user_restrictions[key] = {
-                    'flood': False,
-                    'spam': False,
-                    'media': False,
-                    'checks': False,
-                    'night': False,
-                    'sticker': False,
-                    'gif': False,
-                    'link': False
-                }
-            
-            if restriction_type == "apply":
-                # Apply the restrictions
-                restrictions = user_restrictions[key]
-                
-                # Check if any restrictions are enabled
-                has_restrictions = any(restrictions.values())
-                
-                if has_restrictions:
-                    # Apply restrictions based on toggles
-                    can_send_media = not restrictions['media']
-                    can_send_sticker = not restrictions['sticker']
-                    can_send_gif = not restrictions['gif']
-                    can_send_links = not restrictions['link'] and not restrictions['spam']
-                    
-                    perms = ChatPermissions(
-                        can_send_messages=True,  # Always allow text
-                        can_send_audios=can_send_media,
-                        can_send_documents=can_send_media,
-                        can_send_photos=can_send_media,
-                        can_send_videos=can_send_media,
-                        can_send_video_notes=can_send_media,
-                        can_send_voice_notes=can_send_media,
-                        can_send_polls=not restrictions['spam'],
-                        can_add_web_page_previews=can_send_links
-                    )
-                    
-                    await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
-                    
-                    # Build restriction summary
-                    active = [k.title() for k, v in restrictions.items() if v]
-                    await query.edit_message_text(
-                        f"✅ Restrictions applied!\n\n"
-                        f"Active restrictions: {', '.join(active) if active else 'None'}\n\n"
-                        f"User ID: `{target_id}`",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    # Remove all restrictions
-                    perms = ChatPermissions(
-                        can_send_messages=True,
-                        can_send_audios=True,
-                        can_send_documents=True,
-                        can_send_photos=True,
-                        can_send_videos=True,
-                        can_send_video_notes=True,
-                        can_send_voice_notes=True,
-                        can_send_polls=True,
-                        can_add_web_page_previews=True
-                    )
-                    await context.bot.restrict_chat_member(chat_id, target_id, permissions=perms)
-                    await query.edit_message_text(
-                        f"✅ All restrictions removed!\n\nUser ID: `{target_id}`",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            else:
-                # Toggle the restriction
-                user_restrictions[key][restriction_type] = not user_restrictions[key][restriction_type]
-                restrictions = user_restrictions[key]
-                
-                # Update the keyboard
-                keyboard = [
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['flood'] else '❌'} Flood",
-                            callback_data=f"free_{target_id}_flood"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['spam'] else '❌'} Spam",
-                            callback_data=f"free_{target_id}_spam"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['media'] else '❌'} Media",
-                            callback_data=f"free_{target_id}_media"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['checks'] else '❌'} Checks",
-                            callback_data=f"free_{target_id}_checks"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['sticker'] else '❌'} Sticker",
-                            callback_data=f"free_{target_id}_sticker"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['gif'] else '❌'} GIF",
-                            callback_data=f"free_{target_id}_gif"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['link'] else '❌'} Link",
-                            callback_data=f"free_{target_id}_link"
-                        ),
-                        InlineKeyboardButton(
-                            f"{'✅' if restrictions['night'] else '❌'} Silence/Night",
-                            callback_data=f"free_{target_id}_night"
-                        )
-                    ],
-                    [
-                        InlineKeyboardButton(
-                            "💾 Save & Apply",
-                            callback_data=f"free_{target_id}_apply"
-                        )
-                    ]
-                ]
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_reply_markup(reply_markup=reply_markup)
-                
-    except Exception as e:
-        await query.edit_message_text(f"❌ Failed: {str(e)}")
+        # Update the keyboard
+        reply_markup = make_restriction_kb(target_id, restrictions)
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+
+
+# Callback button handlers: {action: handler(query, context, chat_id, sub, tail)}
+# for callback data of the form "<action>_<sub>_<tail>" (tail may be empty).
+# A callback query can only be answered once: handlers that answer it themselves
+# (e.g. with an alert) return True, otherwise it is answered after the handler runs.
+_CALLBACK_HANDLERS = {
+    "config": _handle_config,
+    "banstatus": _handle_banstatus,
+    "mutestatus": _handle_mutestatus,
+    "unban": _handle_unban,
+    "unmute": _handle_unmute,
+    "action": _handle_action,
+    "free": _handle_free,
+}
+
+
+def make_button_callback(handler):
+    """Wrap a _CALLBACK_HANDLERS entry as a CallbackQueryHandler callback for its own prefix"""
+    async def callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        chat_id = query.message.chat.id
+        
+        # Check if user is admin first (denied users return before any callback data is parsed)
+        if not await is_admin(context, chat_id, query.from_user.id):
+            await query.answer("❌ Only admins can use this button.", show_alert=True)
+            return
+        
+        # Callback data groups (admins only), captured by the handler pattern
+        sub, tail = context.matches[0].groups()
+        
+        answered = False
+        try:
+            answered = await handler(query, context, chat_id, sub, tail)
+        except Exception as e:
+            await query.edit_message_text(f"❌ Failed: {str(e)}")
+        if not answered:
+            await query.answer()
+    
+    callback.__name__ = callback.__qualname__ = f"{handler.__name__.lstrip('_')}_callback"
+    return callback
+
+
+async def answer_unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer callback queries that no button handler matched"""
+    await update.callback_query.answer()
+
+
+# Group-only commands: (command, handler)
+_GROUP_CMDS = (
+    ("status", status_cmd),
+    ("settings", settings_cmd),
+    ("info", info_cmd),
+    ("promote", promote_admin),
+    ("mod", promote_mod),
+    ("muter", promote_muter),
+    ("unadmin", unadmin_cmd),
+    ("unmod", unmod_cmd),
+    ("unmuter", unmuter_cmd),
+    ("ban", ban),
+    ("unban", unban),
+    ("mute", mute),
+    ("unmute", unmute),
+    ("warn", warn),
+    ("warnings", check_warnings),
+    ("free", free_cmd),
+    ("filter", filter_cmd),
+    ("filters", filters_cmd),
+    ("stopfilter", stopfilter_cmd),
+    ("setselfdestruct", set_self_destruct),
+    ("resetselfdestruct", reset_self_destruct),
+    ("enableedit", enable_edit_deletion),
+    ("disableedit", disable_edit_deletion),
+    ("setwarnlimit", set_warn_limit),
+    ("setmutetime", set_mute_time),
+    ("enablensfw", enable_nsfw_filter),
+    ("disablensfw", disable_nsfw_filter),
+    ("reload", reload_config),
+    ("config", config_cmd),
+    ("setwelcomemessage", set_welcome_message),
+    ("setwelcomeimage", set_welcome_image),
+    ("resetwelcome", reset_welcome),
+    ("resetwelcomeimage", reset_welcome_image),
+    ("service", service),
+    ("setservice", set_service),
+    ("resetservice", reset_service),
+    # Service and event message settings
+    ("enable_service", enable_service_msgs),
+    ("disable_service", disable_service_msgs),
+    ("enable_event", enable_event_msgs),
+    ("disable_event", disable_event_msgs),
+    ("set_service_del_time", set_service_del_time),
+    ("set_event_del_time", set_event_del_time),
+)
+
+# Chat filter shared by every group-only handler
+_GROUPS = filters.ChatType.GROUPS
 
 
 def main() -> None:
@@ -3113,114 +3148,84 @@ def main() -> None:
         print("Please create a .env file with your bot token.")
         return
     
+    # Use uvloop's event loop when it is installed (it does not support Windows)
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+    
+    # Restore settings saved by a previous run
+    load_chat_settings()
+    
     # Build application
-    app = ApplicationBuilder().token(token).build()
+    app = (
+        ApplicationBuilder()
+        .token(token)
+        .post_shutdown(save_chat_settings_on_shutdown)
+        .build()
+    )
     
     # Command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("status", status_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("settings", settings_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("info", info_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("promote", promote_admin, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("mod", promote_mod, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("muter", promote_muter, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("unadmin", unadmin_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("unmod", unmod_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("unmuter", unmuter_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("ban", ban, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("unban", unban, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("mute", mute, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("unmute", unmute, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("warn", warn, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("warnings", check_warnings, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("free", free_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("filter", filter_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("filters", filters_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("stopfilter", stopfilter_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setselfdestruct", set_self_destruct, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("resetselfdestruct", reset_self_destruct, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("enableedit", enable_edit_deletion, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("disableedit", disable_edit_deletion, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setwarnlimit", set_warn_limit, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setmutetime", set_mute_time, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("enablensfw", enable_nsfw_filter, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("disablensfw", disable_nsfw_filter, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("reload", reload_config, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("config", config_cmd, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setwelcomemessage", set_welcome_message, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setwelcomeimage", set_welcome_image, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("resetwelcome", reset_welcome, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("resetwelcomeimage", reset_welcome_image, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("service", service, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("setservice", set_service, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("resetservice", reset_service, filters=filters.ChatType.GROUPS))
-    
-    # Service and event message handlers
-    app.add_handler(CommandHandler("enable_service", enable_service_msgs, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("disable_service", disable_service_msgs, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("enable_event", enable_event_msgs, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("disable_event", disable_event_msgs, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("set_service_del_time", set_service_del_time, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler("set_event_del_time", set_event_del_time, filters=filters.ChatType.GROUPS))
+    for name, fn in _GROUP_CMDS:
+        app.add_handler(CommandHandler(name, fn, filters=_GROUPS))
     
     # Callback query handler for buttons
-    app.add_handler(CallbackQueryHandler(button_callback))
+    # One callback handler per button prefix, so PTB routes on the pattern
+    for action, handler in _CALLBACK_HANDLERS.items():
+        pattern = re.compile(rf"^{action}_([^_]*)_?(.*)$")
+        app.add_handler(CallbackQueryHandler(make_button_callback(handler), pattern=pattern))
+    
+    # Buttons matching no prefix (old panels) still need an answer to stop the client spinner
+    app.add_handler(CallbackQueryHandler(answer_unknown_callback))
     
     # Message handlers
     app.add_handler(MessageHandler(
-        filters.StatusUpdate.NEW_CHAT_MEMBERS & filters.ChatType.GROUPS,
+        filters.StatusUpdate.NEW_CHAT_MEMBERS & _GROUPS,
         greet_new_members
     ))
     
-    # Filter check handler (must be before link detection)
+    # Filters, link detection, content restrictions and service/event messages,
+    # all run by one handler (new messages only, so edits still reach on_edited).
+    # Its own group, so join messages reach it after greet_new_members has handled them;
+    # commands are left to the command handlers (and other bots), links and all.
     app.add_handler(MessageHandler(
-        filters.TEXT & filters.ChatType.GROUPS & ~filters.COMMAND,
-        check_filters
-    ))
-    
-    # Link detection handlers
-    app.add_handler(MessageHandler(
-        filters.TEXT & (filters.Entity(MessageEntity.URL) | filters.Entity(MessageEntity.TEXT_LINK)) & filters.ChatType.GROUPS,
-        delete_links
-    ))
-    app.add_handler(MessageHandler(
-        filters.CAPTION & (filters.CaptionEntity(MessageEntity.URL) | filters.CaptionEntity(MessageEntity.TEXT_LINK)) & filters.ChatType.GROUPS,
-        delete_links
-    ))
-    app.add_handler(MessageHandler(
-        filters.ChatType.GROUPS,
-        delete_links
-    ))
-    
-    # Content restriction handler (for stickers, GIFs, videos, etc.)
-    app.add_handler(MessageHandler(
-        filters.ALL & filters.ChatType.GROUPS,
-        check_message_content
-    ))
-    
-    # Service and event message handler
-    app.add_handler(MessageHandler(
-        filters.ChatType.GROUPS,
-        handle_service_event_messages
-    ))
+        filters.UpdateType.MESSAGE & _GROUPS & ~filters.COMMAND,
+        group_message_router
+    ), group=1)
     
     # Edited message handler
     app.add_handler(MessageHandler(
-        filters.UpdateType.EDITED & filters.ChatType.GROUPS,
+        filters.UpdateType.EDITED & _GROUPS,
         on_edited
     ))
     
     # Join request handler
     app.add_handler(ChatJoinRequestHandler(approve_join))
     
+    # Only the update types that have handlers (new members arrive as "message" service updates)
+    allowed_updates = ["message", "edited_message", "callback_query", "chat_join_request"]
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    
     print("✅ Bot started successfully!")
-    print("🤖 Polling for updates...")
     
-    # Start polling
-    app.run_polling(
-        allowed_updates=["message", "edited_message", "chat_member", "my_chat_member", "chat_join_request", "callback_query"]
-    )
+    if webhook_url:
+        # Receive updates pushed by Telegram (set WEBHOOK_URL to the public HTTPS base URL)
+        print("🤖 Listening for webhook updates...")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=int(os.environ.get("PORT", "8443")),
+            url_path=token,
+            webhook_url=f"{webhook_url.rstrip('/')}/{token}",
+            allowed_updates=allowed_updates
+        )
+    else:
+        # Start polling
+        print("🤖 Polling for updates...")
+        app.run_polling(allowed_updates=allowed_updates)
 
 
 if __name__ == "__main__":